@@ -0,0 +1,257 @@
+"""워커 간 이벤트 중계 (uvicorn --workers N 지원)
+
+각 워커는 자기가 가진 WebSocket에만 직접 전송하고,
+다른 워커에 붙은 소켓에는 백플레인을 통해 이벤트를 전달한다.
+
+WS_BACKPLANE 환경변수로 선택
+- local (기본): 단일 프로세스, 중계 없음
+- unix: 같은 서버의 워커끼리 Unix 도메인 데이터그램 소켓으로 중계 (의존성 없음)
+- redis: Redis pub/sub (redis 패키지 필요, 여러 서버에서도 동작)
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WS_BACKPLANE = os.getenv("WS_BACKPLANE", "local")
+WS_BACKPLANE_DIR = os.getenv("WS_BACKPLANE_DIR", "/tmp/investment-academy-bus")
+WS_BACKPLANE_URL = os.getenv("WS_BACKPLANE_URL", "redis://localhost:6379/0")
+WS_BACKPLANE_CHANNEL = os.getenv("WS_BACKPLANE_CHANNEL", "investment-academy")
+
+
+def dumps(data) -> bytes:
+    """JSON 인코딩 (orjson 있으면 사용)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class Backplane:
+    """백플레인 인터페이스
+
+    구현체는 start / publish_raw / close만 제공하면 된다.
+    publish된 이벤트는 다른 워커에서 channel별 핸들러로 전달되고,
+    보낸 워커 자신에게는 다시 전달되지 않는다 (로컬 전송은 호출한 쪽이 직접 처리).
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:12]  # 워커 식별자
+        self.handlers: dict = {}             # channel: handler(payload)
+        self.stats = {"published": 0, "received": 0, "errors": 0}
+
+    def subscribe(self, channel: str, handler):
+        self.handlers[channel] = handler
+
+    async def start(self):
+        pass
+
+    async def publish(self, channel: str, payload: dict):
+        self.stats["published"] += 1
+        await self.publish_raw(dumps({"o": self.origin, "c": channel, "p": payload}))
+
+    async def publish_raw(self, data: bytes):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def dispatch(self, data: bytes):
+        """다른 워커에서 받은 이벤트를 핸들러로 전달"""
+        try:
+            envelope = json.loads(data)
+        except ValueError:
+            self.stats["errors"] += 1
+            return
+        if envelope.get("o") == self.origin:
+            return
+        handler = self.handlers.get(envelope.get("c"))
+        if handler is None:
+            return
+        self.stats["received"] += 1
+        try:
+            handler(envelope.get("p") or {})
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"[BACKPLANE] 핸들러 오류 ({envelope.get('c')}): {e}")
+
+    def get_stats(self):
+        return {"transport": self.name, "origin": self.origin, **self.stats}
+
+
+class LocalBackplane(Backplane):
+    """단일 프로세스 (기본값) - 중계할 워커가 없음"""
+
+    name = "local"
+
+    async def publish(self, channel: str, payload: dict):
+        pass
+
+
+class UnixSocketBackplane(Backplane):
+    """같은 서버의 워커끼리 Unix 데이터그램 소켓으로 중계
+
+    워커마다 디렉터리 안에 자기 소켓을 하나 만들고,
+    publish 시 디렉터리의 다른 소켓 전부에 데이터그램을 보낸다.
+    허브 프로세스가 없어서 워커 하나가 죽어도 나머지는 계속 동작한다.
+    """
+
+    name = "unix"
+    PEER_REFRESH_SECONDS = 1.0
+    MAX_DATAGRAM = 256 * 1024
+    BUFFER_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, directory: str = WS_BACKPLANE_DIR):
+        super().__init__()
+        self.directory = Path(directory)
+        self.path = self.directory / f"{os.getpid()}-{self.origin}.sock"
+        self.sock = None
+        self._peers = []
+        self._peers_loaded_at = 0.0
+        self.stats["dropped"] = 0
+        self.stats["oversize"] = 0  # MAX_DATAGRAM보다 커서 보내지 못한(받다가 잘린) 이벤트
+
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, option, self.BUFFER_SIZE)
+            except OSError:
+                pass
+        self.sock.bind(str(self.path))
+        self.sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._on_readable)
+        print(f"[BACKPLANE] unix 소켓 시작: {self.path}")
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self.sock.recv(self.MAX_DATAGRAM + 1)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if len(data) > self.MAX_DATAGRAM:
+                # 잘린 데이터그램 - 다른 버전의 워커가 보낸 큰 이벤트
+                self.stats["oversize"] += 1
+                print(f"[BACKPLANE] {self.MAX_DATAGRAM}바이트보다 큰 이벤트 수신 - 버림")
+                continue
+            self.dispatch(data)
+
+    def peers(self):
+        now = time.monotonic()
+        if now - self._peers_loaded_at > self.PEER_REFRESH_SECONDS:
+            self._peers = [
+                entry.path for entry in os.scandir(self.directory)
+                if entry.name.endswith(".sock") and entry.path != str(self.path)
+            ]
+            self._peers_loaded_at = now
+        return self._peers
+
+    async def publish_raw(self, data: bytes):
+        if self.sock is None:
+            return
+        if len(data) > self.MAX_DATAGRAM:
+            # 받는 쪽에서 잘리므로 보내지 않음 (redis 백플레인에는 이 제한이 없음)
+            self.stats["oversize"] += 1
+            print(f"[BACKPLANE] 이벤트가 너무 큼 ({len(data)}바이트 > {self.MAX_DATAGRAM}) - 다른 워커에 전달 안 됨")
+            return
+        for peer in self.peers():
+            try:
+                self.sock.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # 죽은 워커가 남긴 소켓 파일
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+                self._peers_loaded_at = 0.0
+            except BlockingIOError:
+                # 상대 워커 수신 버퍼가 가득 참
+                self.stats["dropped"] += 1
+            except OSError as e:
+                self.stats["errors"] += 1
+                print(f"[BACKPLANE] 전송 실패 {peer}: {e}")
+
+    async def close(self):
+        if self.sock is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+        except Exception:
+            pass
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class RedisBackplane(Backplane):
+    """Redis pub/sub 백플레인 (redis 패키지 필요)"""
+
+    name = "redis"
+
+    def __init__(self, url: str = WS_BACKPLANE_URL, channel: str = WS_BACKPLANE_CHANNEL):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self.redis = None
+        self.pubsub = None
+        self.listener = None
+
+    async def start(self):
+        import redis.asyncio as aioredis
+
+        self.redis = aioredis.from_url(self.url)
+        self.pubsub = self.redis.pubsub()
+        await self.pubsub.subscribe(self.channel)
+        self.listener = asyncio.create_task(self._listen())
+        print(f"[BACKPLANE] redis 구독 시작: {self.channel}")
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message.get("type") == "message":
+                        self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[BACKPLANE] redis 수신 오류: {e}")
+                await asyncio.sleep(1)
+
+    async def publish_raw(self, data: bytes):
+        try:
+            await self.redis.publish(self.channel, data)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"[BACKPLANE] redis 전송 오류: {e}")
+
+    async def close(self):
+        if self.listener:
+            self.listener.cancel()
+        if self.pubsub:
+            await self.pubsub.close()
+        if self.redis:
+            await self.redis.close()
+
+
+def create_backplane(kind: str = WS_BACKPLANE) -> Backplane:
+    if kind == "unix":
+        return UnixSocketBackplane()
+    if kind == "redis":
+        return RedisBackplane()
+    return LocalBackplane()
@@ -0,0 +1,90 @@
+"""브로드캐스트 CPU 비용 벤치마크
+
+방 인원수별로 시그널 1건을 브로드캐스트할 때 이벤트 루프가 쓰는 CPU 시간 비교
+- per-recipient: 예전 방식 (수신자마다 send_json → json.dumps)
+- encode-once:   ConnectionManager.send_message (한 번 인코딩 후 큐에 넣기)
+
+실행: python bench_broadcast.py
+"""
+import asyncio
+import json
+import time
+
+from realtime import ConnectionManager, orjson
+
+
+class NullWebSocket:
+    """전송 비용이 없는 가짜 WebSocket (인코딩 비용만 측정)"""
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        # Starlette WebSocket.send_json과 같은 인코딩
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    async def send_text(self, data):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+SIGNAL = {
+    "type": "message",
+    "message": {
+        "id": 123456,
+        "room_id": 3,
+        "user_id": 1,
+        "content": "OPEN\n🟢 포지션 진입 매수(BUY)\n\n📊 【NQ】\n\n💰 진입가: 21500.25\n🛑 손절가: 21450\n🎯 목표가: 21600\n\n투자의 책임은 본인에게 있습니다.",
+        "message_type": "signal",
+        "created_at": "2026-01-05T09:30:00.123456",
+        "user": {"id": 1, "name": "일타교장쌤", "role": "admin"},
+    },
+}
+
+ROOM_SIZES = [10, 100, 500, 1000, 2000]
+ROUNDS = 200
+
+
+async def drain(manager: ConnectionManager):
+    while any(not c.queue.empty() or c.sending for c in manager.connections.values()):
+        await asyncio.sleep(0)
+
+
+async def bench_per_recipient(sockets):
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        for ws in sockets:
+            try:
+                await ws.send_json(SIGNAL)
+            except Exception:
+                pass
+    return (time.process_time() - start) / ROUNDS
+
+
+async def bench_encode_once(size: int):
+    manager = ConnectionManager(queue_size=ROUNDS + 1)
+    for i in range(size):
+        await manager.connect(NullWebSocket(), "3", i)
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        await manager.send_message(SIGNAL, "3")
+    await drain(manager)
+    elapsed = (time.process_time() - start) / ROUNDS
+    for c in list(manager.connections.values()):
+        manager.disconnect(c)
+    return elapsed
+
+
+async def main():
+    print(f"encoder: {'orjson' if orjson else 'json'}, rounds: {ROUNDS}")
+    print(f"{'room size':>10} {'per-recipient (ms)':>20} {'encode-once (ms)':>18} {'speedup':>8}")
+    for size in ROOM_SIZES:
+        legacy = await bench_per_recipient([NullWebSocket() for _ in range(size)])
+        current = await bench_encode_once(size)
+        print(f"{size:>10} {legacy * 1000:>20.3f} {current * 1000:>18.3f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,330 @@
+"""인메모리 캐시 모음
+
+여러 워커로 실행할 때는 백플레인으로 변경 사항을 다른 워커에도 반영한다.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict, deque
+
+from backplane import Backplane, LocalBackplane, dumps
+
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_PAGE_MAX = int(os.getenv("MESSAGE_PAGE_MAX", "200"))      # 한 번에 조회할 수 있는 최대 메시지 수
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))          # 초
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+THREAD_LIST_CACHE_TTL = float(os.getenv("THREAD_LIST_CACHE_TTL", "30"))  # 조회수는 이 주기로 반영
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))  # 쓰기 시 무효화되는 응답의 최대 보관 시간
+
+
+def make_etag(body: bytes) -> str:
+    """응답 본문의 ETag - 내용이 같으면 어느 워커에서 만들어도 같은 값"""
+    return '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class RoomMessageCache:
+    """방별 최근 메시지 페이지 캐시
+
+    메시지 dict(MessageResponse 형식)를 오래된 순으로 보관하고,
+    JSON 인코딩 결과도 변경될 때까지 재사용한다.
+    저장/삭제/리액션 시 무효화하지 않고 직접 추가/제거/수정한다.
+    삭제로 페이지가 모자라지 않도록 page_size보다 조금 더 보관한다.
+    DB에서 채우는 동안 들어온 추가/삭제/리액션은 모아 두었다가 load에서 합친다
+    (조회 스냅샷 이후에 저장된 메시지가 빠지지 않도록).
+    """
+
+    def __init__(self, backplane: Backplane = None, page_size: int = MESSAGE_PAGE_SIZE, spare: int = MESSAGE_PAGE_SIZE):
+        self.backplane = backplane or LocalBackplane()
+        self.backplane.subscribe("messages", self._on_remote_event)
+        self.page_size = page_size
+        self.capacity = page_size + spare
+        self.rooms: dict = {}    # room_id: deque[message dict]
+        self.complete: set = set()  # DB의 메시지 전체를 들고 있는 방 (더 오래된 메시지 없음)
+        self.encoded: dict = {}  # room_id: 최근 페이지 JSON bytes
+        self.loading: dict = {}  # room_id: 로딩 중에 들어온 변경 {"added": {id: message}, "removed": set, "reactions": {id: counts}}
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0}
+
+    def get_page(self, room_id: int):
+        """최근 page_size개 메시지 JSON. 캐시에 없으면 None"""
+        encoded = self.encoded.get(room_id)
+        if encoded is not None:
+            self.stats["hits"] += 1
+            return encoded
+        messages = self.rooms.get(room_id)
+        if messages is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        page = list(messages)[-self.page_size:]
+        encoded = self.encoded[room_id] = dumps(page)
+        return encoded
+
+    def begin_load(self, room_id: int) -> bool:
+        """DB에서 채우기 시작 (조회 전에 호출). 이미 있거나 다른 요청이 채우는 중이면 False"""
+        if room_id in self.rooms or room_id in self.loading:
+            return False
+        self.loading[room_id] = {"added": {}, "removed": set(), "reactions": {}}
+        return True
+
+    def cancel_load(self, room_id: int):
+        self.loading.pop(room_id, None)
+
+    def get_range(self, room_id: int, before_id: int = None, after_id: int = None, limit: int = MESSAGE_PAGE_SIZE):
+        """커서 범위의 메시지 (오래된 순). 캐시만으로 정확히 답할 수 없으면 None
+
+        before_id: 그보다 오래된 limit개 (없으면 최근 limit개), after_id: 그 이후 limit개 (둘 다 있으면 그 사이)
+        """
+        messages = self.rooms.get(room_id)
+        if messages is None:
+            self.stats["misses"] += 1
+            return None
+        complete = room_id in self.complete
+        oldest = messages[0]["id"] if messages else None
+        if after_id is not None:
+            # after_id 바로 다음 메시지부터 캐시에 있어야 함
+            if not complete and (oldest is None or oldest > after_id):
+                self.stats["misses"] += 1
+                return None
+            items = [m for m in messages if m["id"] > after_id and (before_id is None or m["id"] < before_id)]
+            self.stats["hits"] += 1
+            return items[:limit]
+        items = [m for m in messages if before_id is None or m["id"] < before_id]
+        if len(items) < limit and not complete:
+            # 캐시보다 오래된 메시지가 DB에 더 있음
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return items[-limit:]
+
+    def load(self, room_id: int, messages: list):
+        """DB에서 읽은 최근 메시지(오래된 순, 최대 capacity개)로 채우기 (begin_load 이후)"""
+        changes = self.loading.pop(room_id, None)
+        if changes is None:
+            # 로딩 중에 방이 삭제됨
+            return
+        complete = len(messages) < self.capacity
+        items = {message["id"]: message for message in messages}
+        items.update(changes["added"])
+        for message_id in changes["removed"]:
+            items.pop(message_id, None)
+        for message_id, counts in changes["reactions"].items():
+            if message_id in items:
+                items[message_id]["reactions"] = counts
+        merged = [items[message_id] for message_id in sorted(items)]
+        if len(merged) > self.capacity:
+            complete = False
+        self.rooms[room_id] = deque(merged[-self.capacity:], maxlen=self.capacity)
+        if complete:
+            self.complete.add(room_id)
+        else:
+            self.complete.discard(room_id)
+        self.encoded.pop(room_id, None)
+
+    async def add(self, room_id: int, message: dict):
+        self._add(room_id, message)
+        await self.backplane.publish("messages", {"op": "add", "room_id": room_id, "message": message})
+
+    async def remove(self, room_id: int, message_id: int):
+        self._remove(room_id, message_id)
+        await self.backplane.publish("messages", {"op": "remove", "room_id": room_id, "message_id": message_id})
+
+    async def drop(self, room_id: int):
+        self._drop(room_id)
+        await self.backplane.publish("messages", {"op": "drop", "room_id": room_id})
+
+    async def set_reactions(self, room_id: int, message_id: int, counts: dict):
+        self._set_reactions(room_id, message_id, counts)
+        await self.backplane.publish("messages", {"op": "reactions", "room_id": room_id,
+                                                  "message_id": message_id, "counts": counts})
+
+    def _add(self, room_id: int, message: dict):
+        messages = self.rooms.get(room_id)
+        if messages is None:
+            if room_id in self.loading:
+                self.loading[room_id]["added"][message["id"]] = message
+            return
+        if len(messages) == messages.maxlen:
+            # 가장 오래된 메시지가 밀려나므로 더 이상 전체가 아님
+            self.complete.discard(room_id)
+        if messages and messages[-1]["id"] > message["id"]:
+            # 늦게 도착한 메시지 - id 순서 유지
+            items = sorted([*messages, message], key=lambda m: m["id"])
+            messages.clear()
+            messages.extend(items[-self.capacity:])
+        else:
+            messages.append(message)
+        self.encoded.pop(room_id, None)
+
+    def _remove(self, room_id: int, message_id: int):
+        messages = self.rooms.get(room_id)
+        if messages is None:
+            if room_id in self.loading:
+                self.loading[room_id]["added"].pop(message_id, None)
+                self.loading[room_id]["removed"].add(message_id)
+            return
+        for message in messages:
+            if message["id"] == message_id:
+                messages.remove(message)
+                break
+        else:
+            return
+        self.encoded.pop(room_id, None)
+        if len(messages) < self.page_size and room_id not in self.complete:
+            # 여유분까지 다 지워졌으면 다음 조회 때 DB에서 다시 채움
+            self.stats["reloads"] += 1
+            self._drop(room_id)
+
+    def _set_reactions(self, room_id: int, message_id: int, counts: dict):
+        if room_id in self.loading:
+            self.loading[room_id]["reactions"][message_id] = counts
+        for message in self.rooms.get(room_id, ()):
+            if message["id"] == message_id:
+                message["reactions"] = counts
+                self.encoded.pop(room_id, None)
+                return
+
+    def _drop(self, room_id: int):
+        self.rooms.pop(room_id, None)
+        self.loading.pop(room_id, None)
+        self.encoded.pop(room_id, None)
+        self.complete.discard(room_id)
+
+    def _on_remote_event(self, payload: dict):
+        op = payload.get("op")
+        if op == "add":
+            self._add(payload["room_id"], payload["message"])
+        elif op == "remove":
+            self._remove(payload["room_id"], payload["message_id"])
+        elif op == "drop":
+            self._drop(payload["room_id"])
+        elif op == "reactions":
+            self._set_reactions(payload["room_id"], payload["message_id"], payload["counts"])
+
+    def get_stats(self):
+        return {**self.stats, "rooms": len(self.rooms)}
+
+
+class ResponseCache:
+    """직렬화된 응답(bytes) 캐시 - 키는 쿼리 파라미터 조합
+
+    관련 데이터가 바뀌면 clear로 전체를 비우고 다른 워커에도 전달한다.
+    ttl은 명시적으로 무효화하지 않는 값(조회수 등)이 반영되는 최대 지연 시간.
+    """
+
+    def __init__(self, name: str, backplane: Backplane = None, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = 64):
+        self.name = name
+        self.backplane = backplane or LocalBackplane()
+        self.backplane.subscribe(f"response:{name}", self._on_remote_event)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()  # key: (저장 시각, 값)
+        self.generation = 0  # clear마다 증가 - 조회 중에 무효화된 값은 저장하지 않음
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def put(self, key, value, generation: int = None):
+        """generation: 조회 시작 시점의 self.generation (그 사이 clear됐으면 저장 안 함)"""
+        if generation is not None and generation != self.generation:
+            return
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def clear(self):
+        self._clear()
+        await self.backplane.publish(f"response:{self.name}", {})
+
+    def _clear(self):
+        self.entries.clear()
+        self.generation += 1
+        self.stats["invalidations"] += 1
+
+    def _on_remote_event(self, payload: dict):
+        self._clear()
+
+    def get_stats(self):
+        return {**self.stats, "entries": len(self.entries), "ttl": self.ttl}
+
+
+class UserPrincipal:
+    """인증된 사용자 정보 (ORM 객체가 아닌 가벼운 읽기 전용 사본)"""
+
+    __slots__ = ("id", "phone", "name", "role", "is_approved", "expiry_date", "created_at", "cached_at")
+
+    def __init__(self, user):
+        self.id = user.id
+        self.phone = user.phone
+        self.name = user.name
+        self.role = user.role
+        self.is_approved = user.is_approved
+        self.expiry_date = user.expiry_date
+        self.created_at = user.created_at
+        self.cached_at = time.monotonic()
+
+
+class UserCache:
+    """get_current_user용 사용자 캐시 (TTL + 최대 개수, 오래 안 쓴 것부터 제거)
+
+    승인/기간/비밀번호 변경, 삭제 시 invalidate로 바로 지우고
+    다른 워커에도 백플레인으로 전달한다. TTL은 그 외 경로로 바뀐 값의 최대 지연 시간.
+    """
+
+    def __init__(self, backplane: Backplane = None, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.backplane = backplane or LocalBackplane()
+        self.backplane.subscribe("users", self._on_remote_event)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.users: OrderedDict = OrderedDict()  # user_id: UserPrincipal
+        self.generation = 0  # invalidate마다 증가 - DB 조회 중에 무효화된 값은 저장하지 않음
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidations": 0, "stale_puts": 0}
+
+    def get(self, user_id: int):
+        principal = self.users.get(user_id)
+        if principal is None:
+            self.stats["misses"] += 1
+            return None
+        if time.monotonic() - principal.cached_at > self.ttl:
+            del self.users[user_id]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        self.users.move_to_end(user_id)
+        self.stats["hits"] += 1
+        return principal
+
+    def put(self, user, generation: int = None) -> UserPrincipal:
+        """generation: DB 조회 전의 self.generation (그 사이 invalidate됐으면 반환만 하고 저장 안 함)"""
+        principal = UserPrincipal(user)
+        if generation is not None and generation != self.generation:
+            self.stats["stale_puts"] += 1
+            return principal
+        self.users[principal.id] = principal
+        self.users.move_to_end(principal.id)
+        while len(self.users) > self.max_size:
+            self.users.popitem(last=False)
+            self.stats["evicted"] += 1
+        return principal
+
+    async def invalidate(self, user_id: int):
+        self._invalidate(user_id)
+        await self.backplane.publish("users", {"user_id": user_id})
+
+    def _invalidate(self, user_id: int):
+        self.generation += 1
+        if self.users.pop(user_id, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def _on_remote_event(self, payload: dict):
+        self._invalidate(payload["user_id"])
+
+    def get_stats(self):
+        return {**self.stats, "size": len(self.users), "ttl": self.ttl}
@@ -0,0 +1,371 @@
+"""메모리에서 관리하는 카운터 - 안읽은 메시지 개수, 쓰레드 조회수
+
+[UnreadCounter]
+
+방마다 최근 메시지 id를 정렬된 목록으로 들고 있고, 사용자별 마지막 읽은 id(read marker)와
+비교해서 개수를 센다. 메시지 수와 무관하게 방 하나당 이진 탐색 한 번.
+방별로 최근 UNREAD_WINDOW개만 보관하므로 그보다 많이 안 읽었으면 UNREAD_WINDOW로 표시된다.
+
+read marker는 메모리에 바로 반영하고, DB에는 모아서 READ_MARKER_FLUSH_SECONDS마다 한 번에 저장한다.
+여러 워커로 실행할 때는 백플레인 "unread" 채널로 추가/삭제를 전달하고,
+read marker 변경은 읽음 확인마다 보내지 않고 같은 주기로 모아서 한 번에 전달한다.
+
+[ViewCounter]
+조회마다 UPDATE를 하지 않고 워커별로 증가분을 모아 VIEW_COUNT_FLUSH_SECONDS마다
+UPDATE 한 번으로 저장한다. 조회 시에는 저장 전 증가분을 더해서 보여준다.
+"""
+import asyncio
+import os
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+import models
+from backplane import Backplane, LocalBackplane
+
+UNREAD_WINDOW = int(os.getenv("UNREAD_WINDOW", "1000"))
+READ_MARKER_USERS = int(os.getenv("READ_MARKER_USERS", "10000"))  # read marker를 들고 있을 최대 사용자 수
+READ_MARKER_FLUSH_SECONDS = float(os.getenv("READ_MARKER_FLUSH_SECONDS", "1.0"))
+VIEW_COUNT_FLUSH_SECONDS = float(os.getenv("VIEW_COUNT_FLUSH_SECONDS", "5.0"))
+
+
+class UnreadCounter:
+    def __init__(self, backplane: Backplane = None, session_factory=None, window: int = UNREAD_WINDOW,
+                 max_users: int = READ_MARKER_USERS, flush_interval: float = READ_MARKER_FLUSH_SECONDS):
+        self.backplane = backplane or LocalBackplane()
+        self.backplane.subscribe("unread", self._on_remote_event)
+        self.session_factory = session_factory
+        self.window = window
+        self.max_users = max_users
+        self.flush_interval = flush_interval
+        self.rooms: dict = {}              # room_id: 최근 메시지 id (오름차순)
+        self.loading: dict = {}            # room_id: 로딩 중에 추가된 id
+        self.markers: OrderedDict = OrderedDict()  # user_id: {room_id: last_read_message_id}
+        self.dirty: dict = {}              # (user_id, room_id): 아직 DB에 저장 안 된 last_read_message_id
+        self.outgoing: dict = {}           # (user_id, room_id): 아직 다른 워커에 보내지 않은 last_read_message_id
+        self.flush_lock = asyncio.Lock()
+        self.task = None
+        self.stats = {"room_loads": 0, "marker_loads": 0, "marker_evictions": 0,
+                      "reads": 0, "marker_flushes": 0, "markers_written": 0, "flush_failures": 0,
+                      "marker_publishes": 0, "markers_rejected": 0}
+
+    async def start(self):
+        self.task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """남은 read marker 저장 후 종료"""
+        if self.task:
+            async with self.flush_lock:
+                self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.publish_markers()
+        await self.flush()
+
+    # ---------- 방별 메시지 id ----------
+
+    async def ensure_rooms(self, db, room_ids):
+        """아직 메모리에 없는 방은 DB에서 최근 id를 읽어옴 (워커당 방마다 한 번)"""
+        for room_id in room_ids:
+            if room_id in self.rooms or room_id in self.loading:
+                continue
+            self.loading[room_id] = []
+            try:
+                ids = (await db.scalars(
+                    select(models.Message.id)
+                    .where(models.Message.room_id == room_id)
+                    .order_by(models.Message.id.desc())
+                    .limit(self.window)
+                )).all()
+            except Exception:
+                self.loading.pop(room_id, None)
+                raise
+            ids = sorted(set(ids).union(self.loading.pop(room_id)))
+            self.rooms[room_id] = ids[-self.window:]
+            self.stats["room_loads"] += 1
+
+    def latest(self, room_id: int):
+        """방의 가장 최근 메시지 id (메모리에 없으면 None)"""
+        ids = self.rooms.get(room_id)
+        if ids is None:
+            return None
+        return ids[-1] if ids else 0
+
+    def count(self, room_id: int, last_read_id: int) -> int:
+        ids = self.rooms.get(room_id)
+        if not ids:
+            return 0
+        return len(ids) - bisect_right(ids, last_read_id)
+
+    async def add(self, room_id: int, message_id: int):
+        self._add(room_id, message_id)
+        await self.backplane.publish("unread", {"op": "add", "room_id": room_id, "message_id": message_id})
+
+    async def remove(self, room_id: int, message_id: int):
+        self._remove(room_id, message_id)
+        await self.backplane.publish("unread", {"op": "remove", "room_id": room_id, "message_id": message_id})
+
+    async def drop(self, room_id: int):
+        self._drop(room_id)
+        await self.backplane.publish("unread", {"op": "drop", "room_id": room_id})
+
+    def _add(self, room_id: int, message_id: int):
+        if room_id in self.loading:
+            self.loading[room_id].append(message_id)
+            return
+        ids = self.rooms.get(room_id)
+        if ids is None:
+            return
+        if not ids or ids[-1] < message_id:
+            ids.append(message_id)
+        else:
+            insort(ids, message_id)
+        if len(ids) > self.window:
+            del ids[:len(ids) - self.window]
+
+    def _remove(self, room_id: int, message_id: int):
+        ids = self.rooms.get(room_id)
+        if not ids:
+            return
+        index = bisect_right(ids, message_id) - 1
+        if index >= 0 and ids[index] == message_id:
+            del ids[index]
+
+    def _drop(self, room_id: int):
+        self.rooms.pop(room_id, None)
+        for markers in self.markers.values():
+            markers.pop(room_id, None)
+        # 삭제된 방의 marker는 저장하지 않음 (FK 위반)
+        for pending in (self.dirty, self.outgoing):
+            for key in [key for key in pending if key[1] == room_id]:
+                del pending[key]
+
+    # ---------- 사용자별 read marker ----------
+
+    async def get_markers(self, db, user_id: int) -> dict:
+        """사용자의 방별 마지막 읽은 id. 처음 한 번만 DB에서 한 번에 읽음"""
+        markers = self.markers.get(user_id)
+        if markers is not None:
+            self.markers.move_to_end(user_id)
+            return markers
+        rows = (await db.execute(
+            select(models.UserRoomRead.room_id, models.UserRoomRead.last_read_message_id)
+            .where(models.UserRoomRead.user_id == user_id)
+        )).all()
+        self.stats["marker_loads"] += 1
+        loaded = {room_id: last_read or 0 for room_id, last_read in rows}
+        # 아직 DB에 저장 안 된 marker가 더 최신
+        for (dirty_user, room_id), message_id in self.dirty.items():
+            if dirty_user == user_id and message_id > loaded.get(room_id, 0):
+                loaded[room_id] = message_id
+        # 읽는 동안 set_marker로 바뀐 값이 있으면 유지
+        markers = self.markers.setdefault(user_id, loaded)
+        while len(self.markers) > self.max_users:
+            self.markers.popitem(last=False)
+            self.stats["marker_evictions"] += 1
+        return markers
+
+    async def mark_read(self, db, user_id: int, room_id: int, message_id: int = None):
+        """읽음 처리 (message_id 없으면 방의 최신 메시지까지). 바뀌었으면 새 marker, 아니면 None
+
+        marker는 앞으로만 이동하고, DB 저장은 flush 때 모아서 한다.
+        """
+        await self.ensure_rooms(db, [room_id])
+        latest = self.latest(room_id) or 0
+        message_id = latest if message_id is None else min(message_id, latest)
+        markers = await self.get_markers(db, user_id)
+        if message_id <= markers.get(room_id, 0):
+            return None
+        self.stats["reads"] += 1
+        self._set_marker(user_id, room_id, message_id)
+        self.dirty[(user_id, room_id)] = message_id
+        self.outgoing[(user_id, room_id)] = message_id
+        return message_id
+
+    async def publish_markers(self):
+        """모인 read marker 변경을 다른 워커에 한 번에 전달"""
+        if not self.outgoing:
+            return
+        batch, self.outgoing = self.outgoing, {}
+        self.stats["marker_publishes"] += 1
+        await self.backplane.publish("unread", {
+            "op": "markers",
+            "markers": [[user_id, room_id, message_id] for (user_id, room_id), message_id in batch.items()],
+        })
+
+    async def drop_user(self, user_id: int):
+        """사용자 삭제 후 호출 - 그 사용자의 read marker를 버림"""
+        self._drop_user(user_id)
+        await self.backplane.publish("unread", {"op": "drop_user", "user_id": user_id})
+
+    def _drop_user(self, user_id: int):
+        self.markers.pop(user_id, None)
+        for pending in (self.dirty, self.outgoing):
+            for key in [key for key in pending if key[0] == user_id]:
+                del pending[key]
+
+    def _set_marker(self, user_id: int, room_id: int, message_id: int):
+        markers = self.markers.get(user_id)
+        if markers is not None and message_id > markers.get(room_id, 0):
+            markers[room_id] = message_id
+
+    async def flush(self) -> bool:
+        """모인 read marker를 한 트랜잭션으로 저장 (upsert)
+
+        실패하면 한 개씩 다시 저장해서 제약 조건에 걸리는 marker(삭제된 사용자/방)만 버리고,
+        DB 연결 문제처럼 marker와 상관없는 실패면 남은 것을 다음 flush 때 다시 시도
+        """
+        async with self.flush_lock:
+            if not self.dirty or self.session_factory is None:
+                return True
+            batch, self.dirty = self.dirty, {}
+            try:
+                await self._write_markers(batch)
+            except Exception as e:
+                self.stats["flush_failures"] += 1
+                print(f"[DB] read marker {len(batch)}개 일괄 저장 실패, 한 개씩 다시 저장: {getattr(e, 'orig', e)}")
+                remaining = await self._write_each(batch)
+                if remaining:
+                    for key, message_id in remaining.items():
+                        if message_id > self.dirty.get(key, 0):
+                            self.dirty[key] = message_id
+                    print(f"[DB] read marker {len(remaining)}개 저장 실패 (재시도 예정)")
+                    return False
+                return True
+            self.stats["marker_flushes"] += 1
+            self.stats["markers_written"] += len(batch)
+            return True
+
+    async def _write_each(self, batch: dict) -> dict:
+        """marker를 하나씩 저장. 제약 조건 위반은 버리고, 다른 오류가 나면 그것부터 남은 marker 반환"""
+        items = list(batch.items())
+        for index, (key, message_id) in enumerate(items):
+            try:
+                await self._write_markers({key: message_id})
+            except IntegrityError as e:
+                self.stats["markers_rejected"] += 1
+                print(f"[DB] read marker 저장 제외 (user={key[0]}, room={key[1]}): {e.orig}")
+                continue
+            except Exception:
+                return dict(items[index:])
+            self.stats["markers_written"] += 1
+        return {}
+
+    async def _write_markers(self, batch: dict):
+        async with self.session_factory() as db:
+            user_ids = {user_id for user_id, _ in batch}
+            rows = (await db.scalars(
+                select(models.UserRoomRead).where(models.UserRoomRead.user_id.in_(user_ids))
+            )).all()
+            existing = {(row.user_id, row.room_id): row for row in rows}
+            for (user_id, room_id), message_id in batch.items():
+                row = existing.get((user_id, room_id))
+                if row is None:
+                    db.add(models.UserRoomRead(user_id=user_id, room_id=room_id, last_read_message_id=message_id))
+                elif message_id > (row.last_read_message_id or 0):
+                    row.last_read_message_id = message_id
+            await db.commit()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.publish_markers()
+            await self.flush()
+
+    async def get_counts(self, db, user_id: int, room_ids) -> dict:
+        """방별 안읽은 개수 {room_id: count}"""
+        await self.ensure_rooms(db, room_ids)
+        markers = await self.get_markers(db, user_id)
+        return {room_id: self.count(room_id, markers.get(room_id, 0)) for room_id in room_ids}
+
+    def _on_remote_event(self, payload: dict):
+        op = payload.get("op")
+        if op == "add":
+            self._add(payload["room_id"], payload["message_id"])
+        elif op == "remove":
+            self._remove(payload["room_id"], payload["message_id"])
+        elif op == "drop":
+            self._drop(payload["room_id"])
+        elif op == "drop_user":
+            self._drop_user(payload["user_id"])
+        elif op == "markers":
+            for user_id, room_id, message_id in payload["markers"]:
+                self._set_marker(user_id, room_id, message_id)
+
+    def get_stats(self):
+        return {**self.stats, "rooms": len(self.rooms), "users": len(self.markers), "window": self.window,
+                "pending_markers": len(self.dirty)}
+
+
+class ViewCounter:
+    def __init__(self, session_factory, flush_interval: float = VIEW_COUNT_FLUSH_SECONDS):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.pending: dict = {}  # thread_id: 아직 DB에 저장 안 된 조회수 증가분
+        self.flush_lock = asyncio.Lock()
+        self.task = None
+        self.stats = {"views": 0, "flushes": 0, "rows_written": 0, "flush_failures": 0}
+
+    async def start(self):
+        self.task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """남은 증가분 저장 후 종료"""
+        if self.task:
+            async with self.flush_lock:
+                self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+    def add(self, thread_id: int, count: int = 1):
+        self.pending[thread_id] = self.pending.get(thread_id, 0) + count
+        self.stats["views"] += count
+
+    def get(self, thread_id: int, stored: int) -> int:
+        """DB 값 + 저장 전 증가분"""
+        return (stored or 0) + self.pending.get(thread_id, 0)
+
+    async def flush(self) -> bool:
+        """모인 증가분을 UPDATE 한 번으로 저장. 실패하면 다음 flush 때 다시 시도"""
+        async with self.flush_lock:
+            if not self.pending:
+                return True
+            batch, self.pending = self.pending, {}
+            try:
+                async with self.session_factory() as db:
+                    # UPDATE threads SET view_count = view_count + CASE id WHEN ... END WHERE id IN (...)
+                    await db.execute(
+                        update(models.Thread)
+                        .where(models.Thread.id.in_(batch))
+                        .values(view_count=func.coalesce(models.Thread.view_count, 0)
+                                + case(batch, value=models.Thread.id, else_=0),
+                                updated_at=models.Thread.updated_at)  # 조회는 수정이 아니므로 onupdate 막음
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+            except Exception as e:
+                for thread_id, count in batch.items():
+                    self.pending[thread_id] = self.pending.get(thread_id, 0) + count
+                self.stats["flush_failures"] += 1
+                print(f"[DB] 조회수 {len(batch)}건 저장 실패 (재시도 예정): {e}")
+                return False
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(batch)
+            return True
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def get_stats(self):
+        return {**self.stats, "pending_threads": len(self.pending), "pending_views": sum(self.pending.values())}
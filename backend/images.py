@@ -0,0 +1,167 @@
+"""이미지 파생본 (썸네일 / WebP)
+
+업로드된 이미지마다 크기를 줄인 WebP 파생본을 원본 옆에 만든다.
+    uploads/<원본 파일명>.thumb.webp    최대 320px (목록, 미리보기)
+    uploads/<원본 파일명>.preview.webp  최대 960px (채팅 본문, 클릭하면 원본)
+GIF는 애니메이션이 사라지지 않도록 썸네일만 만든다.
+
+Pillow 작업은 CPU를 많이 써서 프로세스 풀에서 실행한다.
+서버 프로세스에는 이미 스레드(aiosqlite, to_thread)가 돌고 있어서 fork 대신 spawn으로 워커를 만든다.
+워커가 죽으면(BrokenProcessPool) 풀을 새로 만들고, 이미지로 읽을 수 없는 파일만 다시 시도하지 않는다.
+예전 업로드처럼 파생본이 없으면 처음 요청될 때 만든다 (uploads.UploadFiles).
+Pillow가 설치되어 있지 않으면 파생본 없이 원본만 사용한다.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    Image = None
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+IMAGE_VARIANTS = {"thumb": 320, "preview": 960}  # 이름: 최대 가로/세로 px
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+
+def variant_filename(filename: str, variant: str) -> str:
+    return f"{filename}.{variant}.webp"
+
+
+def parse_variant_filename(name: str):
+    """파생본 파일명이면 (원본 파일명, 파생본 이름), 아니면 None"""
+    for variant in IMAGE_VARIANTS:
+        suffix = f".{variant}.webp"
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)], variant
+    return None
+
+
+def variants_for(filename: str) -> list:
+    ext = Path(filename).suffix.lower()
+    if ext not in IMAGE_EXTENSIONS:
+        return []
+    if ext == ".gif":
+        return ["thumb"]
+    return list(IMAGE_VARIANTS)
+
+
+def _render_variants(src: str, variants: dict, quality: int) -> int:
+    """(프로세스 풀에서 실행) src의 파생본 생성, 이미 있는 것은 건너뜀. 만든 개수 반환"""
+    pending = {variant: size for variant, size in variants.items() if not os.path.exists(f"{src}.{variant}.webp")}
+    if not pending:
+        return 0
+    with Image.open(src) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.mode in ("P", "LA", "PA") else "RGB")
+        for variant, size in pending.items():
+            dest = f"{src}.{variant}.webp"
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            resized.save(f"{dest}.part", "WEBP", quality=quality, method=4)
+            os.replace(f"{dest}.part", dest)
+    return len(pending)
+
+
+def _is_decode_error(error: Exception) -> bool:
+    """파일 내용 때문에 생긴 오류인지 (디스크 오류처럼 errno가 있는 OSError는 제외)"""
+    if isinstance(error, (UnidentifiedImageError, Image.DecompressionBombError, SyntaxError, ValueError)):
+        return True
+    return isinstance(error, OSError) and error.errno is None
+
+
+class ImageProcessor:
+    def __init__(self, directory: Path, workers: int = IMAGE_WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self.executor = None     # 첫 사용 시 생성
+        self.inflight: dict = {}  # 원본 파일명: 생성 중인 task (같은 원본 중복 작업 방지)
+        self.failed: set = set()  # 이미지로 읽을 수 없었던 원본 (다시 시도하지 않음)
+        self.stats = {"processed": 0, "variants_created": 0, "lazy": 0, "failures": 0, "pool_restarts": 0}
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def variant_urls(self, filename: str):
+        """원본 파일명의 파생본 URL {이름: URL}. 이미지가 아니거나 Pillow가 없거나 파생본을 만들 수 없었으면 None"""
+        variants = variants_for(filename) if self.available and filename not in self.failed else []
+        if not variants:
+            return None
+        return {variant: f"/uploads/{variant_filename(filename, variant)}" for variant in variants}
+
+    def urls_for(self, file_url: str):
+        """메시지 file_url(/uploads/파일명)의 파생본 URL"""
+        if not file_url or not file_url.startswith("/uploads/"):
+            return None
+        filename = file_url[len("/uploads/"):]
+        if "/" in filename:
+            return None
+        return self.variant_urls(filename)
+
+    async def process(self, filename: str, lazy: bool = False) -> bool:
+        """원본의 파생본 생성 (없는 것만). 같은 원본에 대한 동시 요청은 같은 작업을 기다림"""
+        task = self.schedule(filename, lazy)
+        if task is None:
+            return False
+        return await asyncio.shield(task)
+
+    def schedule(self, filename: str, lazy: bool = False):
+        """파생본 생성 작업을 시작만 하고 바로 반환 (끝날 때까지 inflight가 참조를 보관). 대상이 아니면 None"""
+        if not variants_for(filename) or not self.available or os.path.basename(filename) != filename:
+            return None
+        if filename in self.failed:
+            return None
+        task = self.inflight.get(filename)
+        if task is None:
+            if lazy:
+                self.stats["lazy"] += 1
+            task = asyncio.ensure_future(self._process(filename))
+            self.inflight[filename] = task
+            task.add_done_callback(lambda _: self.inflight.pop(filename, None))
+        return task
+
+    async def _process(self, filename: str) -> bool:
+        src = self.directory / filename
+        if not await asyncio.to_thread(src.is_file):
+            return False
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        executor = self.executor
+        variants = {variant: IMAGE_VARIANTS[variant] for variant in variants_for(filename)}
+        try:
+            created = await asyncio.get_running_loop().run_in_executor(
+                executor, _render_variants, str(src), variants, WEBP_QUALITY
+            )
+        except BrokenProcessPool as e:
+            # 워커 프로세스가 죽음 - 파일 문제가 아니므로 풀만 새로 만들고 다음 요청 때 다시 시도
+            if self.executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+                self.stats["pool_restarts"] += 1
+            self.stats["failures"] += 1
+            print(f"[IMAGE] 이미지 워커 종료됨, 풀 다시 생성 {filename}: {e}")
+            return False
+        except Exception as e:
+            if _is_decode_error(e):
+                # 이미지로 읽을 수 없는 파일 - 다시 시도하지 않음
+                self.failed.add(filename)
+            self.stats["failures"] += 1
+            print(f"[IMAGE] 파생본 생성 실패 {filename}: {e}")
+            return False
+        self.stats["processed"] += 1
+        self.stats["variants_created"] += created
+        return True
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self):
+        return {**self.stats, "available": self.available, "workers": self.workers, "inflight": len(self.inflight)}
@@ -1,28 +1,39 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, UploadFile, File, Header, Request, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, UploadFile, File, Header, Request, Query, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, defer
+from sqlalchemy import select, func, delete, update, or_, and_
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from datetime import datetime, timedelta
 import jwt
-import bcrypt
 from pydantic import BaseModel
 import json
 import os
-import uuid
-from pathlib import Path
-
-from database import get_db, engine, SessionLocal
+import asyncio
+
+from database import get_db, AsyncSessionLocal, write_engine, get_pool_stats, close_engines
+from realtime import ConnectionManager, ReactionCoalescer
+from backplane import LocalBackplane, create_backplane, dumps
+from caches import RoomMessageCache, UserCache, UserPrincipal, ResponseCache, make_etag, MESSAGE_PAGE_SIZE, MESSAGE_PAGE_MAX, THREAD_LIST_CACHE_TTL
+from persistence import MessageWriter
+from passwords import PasswordHasher
+from counters import UnreadCounter, ViewCounter
+from migrations import run_migrations
+from images import ImageProcessor
+from registry import Registry, RoomInfo
+from uploads import UPLOAD_DIR, UploadFiles, UploadLimitMiddleware, UploadStore, clean_temp_files, IMAGE_MAX_BYTES, FILE_MAX_BYTES, IMAGE_TOO_LARGE, FILE_TOO_LARGE
 import models
 import schemas
-from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint, Index
 
 # 리액션 모델 정의
 class MessageReaction(models.Base):
     __tablename__ = "message_reactions"
     __table_args__ = (
         UniqueConstraint('message_id', 'user_id', 'reaction_type', name='unique_reaction'),
+        Index('ix_message_reactions_message_id_type', 'message_id', 'reaction_type'),
         {'extend_existing': True}
     )
     
@@ -32,14 +43,19 @@ class MessageReaction(models.Base):
     reaction_type = Column(String(20), nullable=False)  # 'heart', 'thumbsup'
 
 # 업로드 폴더 생성
-UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# 데이터베이스 테이블 생성
-models.Base.metadata.create_all(bind=engine)
+# 이미지 썸네일/WebP 파생본 (프로세스 풀)
+image_processor = ImageProcessor(UPLOAD_DIR)
 
 app = FastAPI(title="투자학당 - Investment Academy")
 
+# 업로드 크기 제한 (CORS보다 안쪽에 있어야 413 응답에도 CORS 헤더가 붙음)
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/api/upload/image": (IMAGE_MAX_BYTES, IMAGE_TOO_LARGE),
+    "/api/upload/file": (FILE_MAX_BYTES, FILE_TOO_LARGE),
+})
+
 # CORS 설정
 app.add_middleware(
     CORSMiddleware,
@@ -47,10 +63,12 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # 업로드된 파일 서빙
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+upload_files = UploadFiles(directory=UPLOAD_DIR, image_processor=image_processor)
+app.mount("/uploads", upload_files, name="uploads")
 
 # 헬스체크 API (서버 깨우기용)
 @app.get("/health")
@@ -68,67 +86,35 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24시간
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token", auto_error=False)
 
-# WebSocket 연결 관리자
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict = {}
-        self.user_connections: dict = {}    # user_id: websocket
-        self.online_users: dict = {}        # room_id: {user_id: user_info}
-
-    async def connect(self, websocket: WebSocket, room_id: str, user_id: int, user_name: str = "", user_role: str = ""):
-        await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append(websocket)
-        self.user_connections[user_id] = websocket
-        
-        # 접속자 정보 저장
-        if room_id not in self.online_users:
-            self.online_users[room_id] = {}
-        self.online_users[room_id][user_id] = {
-            "user_id": user_id,
-            "name": user_name,
-            "role": user_role,
-            "connected_at": datetime.utcnow().isoformat()
-        }
-
-    def disconnect(self, websocket: WebSocket, room_id: str, user_id: int):
-        if room_id in self.active_connections and websocket in self.active_connections[room_id]:
-            self.active_connections[room_id].remove(websocket)
-        if user_id in self.user_connections:
-            del self.user_connections[user_id]
-        # 접속자 정보 제거
-        if room_id in self.online_users and user_id in self.online_users[room_id]:
-            del self.online_users[room_id][user_id]
-
-    async def send_message(self, message: dict, room_id: str):
-        if room_id in self.active_connections:
-            for connection in self.active_connections[room_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    pass
-    
-    def get_online_users(self, room_id: str = None):
-        if room_id:
-            return list(self.online_users.get(room_id, {}).values())
-        # 전체 접속자
-        all_users = []
-        for rid, users in self.online_users.items():
-            for uid, info in users.items():
-                info_copy = info.copy()
-                info_copy["room_id"] = rid
-                all_users.append(info_copy)
-        return all_users
-
-manager = ConnectionManager()
+# 워커 간 이벤트 중계 (WS_BACKPLANE=local|unix|redis)
+backplane = create_backplane()
+
+# WebSocket 연결 관리자 (연결별 송신 큐 + writer 태스크)
+manager = ConnectionManager(backplane)
+reaction_broadcaster = ReactionCoalescer(manager)
+
+# 방별 최근 메시지 캐시 (메시지 저장/삭제 시 직접 갱신)
+message_cache = RoomMessageCache(backplane)
+user_cache = UserCache(backplane)
+registry = Registry(backplane)  # 방/설정 (시작 시 로드)
+thread_list_cache = ResponseCache("threads", backplane, ttl=THREAD_LIST_CACHE_TTL)
+room_list_cache = ResponseCache("rooms", backplane)
+setting_cache = ResponseCache("settings", backplane)
+market_response_cache = ResponseCache("market", backplane, ttl=60)  # 30분 지난 데이터는 폴백으로 바뀌므로 짧게
+password_hasher = PasswordHasher()
+unread_counter = UnreadCounter(backplane, AsyncSessionLocal)
+view_counter = ViewCounter(AsyncSessionLocal)
+upload_store = UploadStore(AsyncSessionLocal)  # 내용 해시로 중복 제거 + 참조 없는 파일 정리
+
+# 메시지 저장 (MESSAGE_PERSIST_MODE=sync|group)
+message_writer = MessageWriter(AsyncSessionLocal, multi_worker=not isinstance(backplane, LocalBackplane))
 
 # 유틸리티 함수
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -136,6 +122,52 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def serialize_message(message: models.Message, user: Optional[models.User]) -> dict:
+    """메시지 캐시용 dict (schemas.MessageResponse 형식)"""
+    return {
+        "id": message.id,
+        "room_id": message.room_id,
+        "user_id": message.user_id,
+        "content": message.content,
+        "message_type": message.message_type,
+        "file_url": message.file_url,
+        "file_name": message.file_name,
+        "created_at": message.created_at.isoformat(),
+        "user": {"id": user.id, "name": user.name, "role": user.role} if user else None,
+        "reactions": {"heart": message.heart_count or 0, "thumbsup": message.thumbsup_count or 0},
+        "variants": image_processor.urls_for(message.file_url) if message.message_type == "image" else None
+    }
+
+# 조건부 GET (ETag) - 공개 응답은 CDN이 HTTP_CACHE_MAX_AGE초 동안 캐시해도 됨
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "30"))
+PUBLIC_CACHE_CONTROL = f"public, max-age={HTTP_CACHE_MAX_AGE}"
+PRIVATE_CACHE_CONTROL = "private, no-cache"  # 로그인 필요 응답: 브라우저만, 매번 ETag로 재검증
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+def cached_json_response(request: Request, body: bytes, etag: str, cache_control: str = PUBLIC_CACHE_CONTROL,
+                         headers: Optional[dict] = None) -> Response:
+    """캐시된 JSON 본문 응답. If-None-Match가 맞으면 본문 없이 304"""
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(headers or {})}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def get_room_list(is_free: bool):
+    """방 목록 (본문, ETag) - 방 생성/수정/삭제 때까지 캐시"""
+    cached = room_list_cache.get(is_free)
+    if cached is None:
+        rooms = registry.list_rooms(is_free)
+        body = dumps([schemas.RoomResponse.model_validate(room).model_dump(mode="json") for room in rooms])
+        cached = (body, make_etag(body))
+        room_list_cache.put(is_free, cached)
+    return cached
+
 def format_phone_number(phone: str) -> str:
     phone = phone.replace("-", "")
     if len(phone) == 11:
@@ -144,8 +176,18 @@ def format_phone_number(phone: str) -> str:
         return f"{phone[:3]}-{phone[3:6]}-{phone[6:]}"
     return phone
 
+async def load_principal(db: AsyncSession, user_id: int) -> Optional[UserPrincipal]:
+    """사용자 캐시 조회, 없으면 DB에서 읽어 캐시"""
+    principal = user_cache.get(user_id)
+    if principal is None:
+        generation = user_cache.generation
+        user = await db.get(models.User, user_id)
+        if user:
+            principal = user_cache.put(user, generation)
+    return principal
+
 # 인증 함수
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserPrincipal:
     if not token:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -154,12 +196,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         user_id: int = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="유효하지 않은 토큰입니다")
+        user_id = int(user_id)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="토큰이 만료되었습니다")
-    except jwt.PyJWTError:
+    except (jwt.PyJWTError, ValueError):
         raise HTTPException(status_code=401, detail="유효하지 않은 토큰입니다")
     
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await load_principal(db, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="사용자를 찾을 수 없습니다")
     if not user.is_approved:
@@ -169,7 +212,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     
     return user
 
-async def get_current_user_optional(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user_optional(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     """선택적 인증 - 실패해도 None 반환"""
     if not token:
         return None
@@ -178,12 +221,12 @@ async def get_current_user_optional(token: str = Depends(oauth2_scheme), db: Ses
         user_id = payload.get("sub")
         if user_id is None:
             return None
-        user = db.query(models.User).filter(models.User.id == user_id).first()
+        user = await load_principal(db, int(user_id))
         return user if user and user.is_approved else None
     except:
         return None
 
-async def get_admin_user(current_user: models.User = Depends(get_current_user)):
+async def get_admin_user(current_user: UserPrincipal = Depends(get_current_user)) -> UserPrincipal:
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
     return current_user
@@ -191,31 +234,31 @@ async def get_admin_user(current_user: models.User = Depends(get_current_user)):
 # ==================== 인증 API ====================
 
 @app.post("/api/register", response_model=schemas.UserResponse)
-async def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     phone = format_phone_number(user_data.phone)
     
-    existing = db.query(models.User).filter(models.User.phone == phone).first()
+    existing = await db.scalar(select(models.User).where(models.User.phone == phone))
     if existing:
         raise HTTPException(status_code=400, detail="이미 등록된 전화번호입니다")
     
     new_user = models.User(
         phone=phone,
-        password=get_password_hash(user_data.password),
+        password=await get_password_hash(user_data.password),
         name=user_data.name,
         role="member",
         is_approved=False
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @app.post("/api/token")
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     phone = format_phone_number(form_data.username)
-    user = db.query(models.User).filter(models.User.phone == phone).first()
+    user = await db.scalar(select(models.User).where(models.User.phone == phone))
     
-    if not user or not verify_password(form_data.password, user.password):
+    if not user or not await verify_password(form_data.password, user.password):
         raise HTTPException(status_code=401, detail="전화번호 또는 비밀번호가 올바르지 않습니다")
     
     if not user.is_approved:
@@ -224,6 +267,11 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     if user.role == "member" and user.expiry_date and user.expiry_date < datetime.utcnow():
         raise HTTPException(status_code=403, detail="회원 기간이 만료되었습니다")
     
+    # BCRYPT_ROUNDS가 바뀌었으면 새 work factor로 다시 저장
+    if password_hasher.needs_rehash(user.password):
+        user.password = await password_hasher.rehash(form_data.password)
+        await db.commit()
+    
     access_token = create_access_token(
         data={"sub": user.id, "role": user.role},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -236,175 +284,206 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     }
 
 @app.get("/api/me", response_model=schemas.UserResponse)
-async def get_me(current_user: models.User = Depends(get_current_user)):
+async def get_me(current_user: UserPrincipal = Depends(get_current_user)):
     return current_user
 
 # ==================== 관리자 API ====================
 
 @app.get("/api/admin/users", response_model=List[schemas.UserResponse])
-async def get_all_users(admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    return db.query(models.User).all()
+async def get_all_users(admin: UserPrincipal = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
+    return (await db.scalars(select(models.User))).all()
 
 @app.put("/api/admin/users/{user_id}/approve")
-async def approve_user(user_id: int, admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def approve_user(user_id: int, admin: UserPrincipal = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
     user.is_approved = True
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user_id)
     return {"message": "승인되었습니다"}
 
 @app.put("/api/admin/users/{user_id}/password")
-async def change_user_password(user_id: int, password_data: schemas.PasswordChange, admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def change_user_password(user_id: int, password_data: schemas.PasswordChange, admin: UserPrincipal = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
-    user.password = get_password_hash(password_data.new_password)
-    db.commit()
+    user.password = await get_password_hash(password_data.new_password)
+    await db.commit()
+    await user_cache.invalidate(user_id)
     return {"message": "비밀번호가 변경되었습니다"}
 
 @app.put("/api/admin/users/{user_id}/expiry")
-async def update_user_expiry(user_id: int, expiry_data: schemas.ExpiryUpdate, admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def update_user_expiry(user_id: int, expiry_data: schemas.ExpiryUpdate, admin: UserPrincipal = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
     user.expiry_date = expiry_data.expiry_date
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user_id)
     return {"message": "회원 기간이 설정되었습니다"}
 
 @app.post("/api/admin/staff", response_model=schemas.UserResponse)
-async def create_staff(staff_data: schemas.StaffCreate, admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def create_staff(staff_data: schemas.StaffCreate, admin: UserPrincipal = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
     phone = format_phone_number(staff_data.phone)
-    existing = db.query(models.User).filter(models.User.phone == phone).first()
+    existing = await db.scalar(select(models.User).where(models.User.phone == phone))
     if existing:
         raise HTTPException(status_code=400, detail="이미 등록된 전화번호입니다")
     
     new_staff = models.User(
         phone=phone,
-        password=get_password_hash(staff_data.password),
+        password=await get_password_hash(staff_data.password),
         name=staff_data.name,
         role="staff",
         is_approved=True
     )
     db.add(new_staff)
-    db.commit()
-    db.refresh(new_staff)
+    await db.commit()
+    await db.refresh(new_staff)
     return new_staff
 
 @app.delete("/api/admin/users/{user_id}")
-async def delete_user(user_id: int, admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def delete_user(user_id: int, admin: UserPrincipal = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
     if user.role == "admin":
         raise HTTPException(status_code=403, detail="관리자는 삭제할 수 없습니다")
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    await user_cache.invalidate(user_id)
+    await unread_counter.drop_user(user_id)
     return {"message": "사용자가 삭제되었습니다"}
 
 # ==================== 채팅방 API ====================
 
 @app.get("/api/admin/online-users")
-async def get_online_users(room_id: int = None, admin: models.User = Depends(get_admin_user)):
+async def get_online_users(room_id: int = None, admin: UserPrincipal = Depends(get_admin_user)):
     """현재 접속 중인 사용자 목록 (관리자 전용)"""
     if room_id:
         return {"users": manager.get_online_users(str(room_id)), "room_id": room_id}
     return {"users": manager.get_online_users()}
 
+@app.get("/api/admin/metrics")
+async def get_metrics(admin: UserPrincipal = Depends(get_admin_user)):
+    """서버 내부 지표 (관리자 전용)"""
+    return {
+        "websocket": manager.get_stats(),
+        "reaction_broadcast": reaction_broadcaster.get_stats(),
+        "message_cache": message_cache.get_stats(),
+        "user_cache": user_cache.get_stats(),
+        "registry": registry.get_stats(),
+        "thread_list_cache": thread_list_cache.get_stats(),
+        "room_list_cache": room_list_cache.get_stats(),
+        "setting_cache": setting_cache.get_stats(),
+        "market_response_cache": market_response_cache.get_stats(),
+        "unread": unread_counter.get_stats(),
+        "thread_views": view_counter.get_stats(),
+        "password_hasher": password_hasher.get_stats(),
+        "image_processor": image_processor.get_stats(),
+        "uploads": upload_store.get_stats(),
+        "upload_serving": upload_files.get_stats(),
+        "message_writer": message_writer.get_stats(),
+        "db_pool": get_pool_stats()
+    }
+
 @app.get("/api/rooms/free", response_model=List[schemas.RoomResponse])
-async def get_free_rooms(db: Session = Depends(get_db)):
-    return db.query(models.Room).filter(models.Room.is_free == True).all()
+async def get_free_rooms(request: Request):
+    body, etag = get_room_list(True)
+    return cached_json_response(request, body, etag)
 
 @app.get("/api/rooms/paid", response_model=List[schemas.RoomResponse])
-async def get_paid_rooms(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(models.Room).filter(models.Room.is_free == False).all()
+async def get_paid_rooms(request: Request, current_user: UserPrincipal = Depends(get_current_user)):
+    body, etag = get_room_list(False)
+    return cached_json_response(request, body, etag, PRIVATE_CACHE_CONTROL)
 
 # ==================== 안읽은 메시지 API ====================
 
 @app.get("/api/rooms/unread")
-async def get_unread_counts(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """모든 방의 안읽은 메시지 개수 조회"""
-    from sqlalchemy import func
-    
-    result = {}
-    
+async def get_unread_counts(current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """모든 방의 안읽은 메시지 개수 조회 (메모리의 방별 최근 id와 read marker로 계산)"""
     # 사용자가 접근 가능한 방 목록 (유료방)
-    rooms = db.query(models.Room).filter(models.Room.is_free == False).all()
-    
-    for room in rooms:
-        # 사용자의 마지막 읽은 메시지 ID 조회
-        user_read = db.query(models.UserRoomRead).filter(
-            models.UserRoomRead.user_id == current_user.id,
-            models.UserRoomRead.room_id == room.id
-        ).first()
-        
-        last_read_id = user_read.last_read_message_id if user_read else 0
-        
-        # 마지막 읽은 메시지 이후의 메시지 개수
-        unread_count = db.query(func.count(models.Message.id)).filter(
-            models.Message.room_id == room.id,
-            models.Message.id > last_read_id
-        ).scalar()
-        
-        result[room.id] = unread_count
+    room_ids = [room.id for room in registry.list_rooms(is_free=False)]
     
-    return result
+    if any(room_id not in unread_counter.rooms for room_id in room_ids):
+        # 처음 읽는 방이 있으면 저장 대기 중인 메시지까지 DB에 반영 후 로드
+        await message_writer.flush()
+    
+    return await unread_counter.get_counts(db, current_user.id, room_ids)
 
 @app.post("/api/rooms/{room_id}/read")
 async def mark_room_as_read(
     room_id: int, 
-    current_user: models.User = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user), 
+    db: AsyncSession = Depends(get_db)
 ):
-    """특정 방을 읽음으로 표시"""
-    from sqlalchemy import func
-    
-    # 해당 방의 가장 최근 메시지 ID 조회
-    latest_message = db.query(func.max(models.Message.id)).filter(
-        models.Message.room_id == room_id
-    ).scalar()
-    
-    if latest_message is None:
-        latest_message = 0
-    
-    # 기존 레코드 확인
-    user_read = db.query(models.UserRoomRead).filter(
-        models.UserRoomRead.user_id == current_user.id,
-        models.UserRoomRead.room_id == room_id
-    ).first()
-    
-    if user_read:
-        user_read.last_read_message_id = latest_message
-        user_read.updated_at = datetime.now()
-    else:
-        user_read = models.UserRoomRead(
-            user_id=current_user.id,
-            room_id=room_id,
-            last_read_message_id=latest_message
-        )
-        db.add(user_read)
-    
-    db.commit()
+    """특정 방을 읽음으로 표시 (WebSocket의 read 프레임과 같은 처리)"""
+    if not registry.get_room(room_id):
+        raise HTTPException(status_code=404, detail="채팅방을 찾을 수 없습니다")
+    await acknowledge_read(db, current_user.id, room_id)
+    latest_message = unread_counter.latest(room_id)
     
     return {"success": True, "room_id": room_id, "last_read_message_id": latest_message}
 
+def can_read_room(user, room: Optional[RoomInfo]) -> bool:
+    """WebSocket read 프레임의 방 확인 - 없는 방, 접근할 수 없는 유료방(만료된 회원)은 거부"""
+    if room is None:
+        return False
+    if room.is_free:
+        return True
+    if not user.is_approved:
+        return False
+    return not (user.role == "member" and user.expiry_date and user.expiry_date < datetime.utcnow())
+
+async def acknowledge_read(db: AsyncSession, user_id: int, room_id: int, message_id: Optional[int] = None,
+                           connection=None):
+    """read marker 갱신 후 그 사용자의 다른 연결(탭/기기)에도 배지 값 전송. DB 저장은 모아서 처리
+
+    connection: read 프레임을 보낸 연결 (이미 알고 있으므로 다시 보내지 않음)
+    """
+    if room_id not in unread_counter.rooms:
+        # 처음 읽는 방이면 저장 대기 중인 메시지까지 DB에 반영 후 로드 (get_unread_counts와 같음)
+        await message_writer.flush()
+    marker = await unread_counter.mark_read(db, user_id, room_id, message_id)
+    if marker is not None:
+        await manager.send_to_user(user_id, {
+            "type": "read",
+            "room_id": room_id,
+            "message_id": marker,
+            "unread": unread_counter.count(room_id, marker)
+        }, exclude=connection)
+    return marker
+
+async def notify_unread(room: RoomInfo, message_id: int, sender_id: int):
+    """유료방에 새 메시지 - 다른 방에 접속 중인 사용자에게 배지 +1 전송 (같은 방은 메시지를 직접 받음)"""
+    if room.is_free:
+        return
+    await manager.send_to_all(
+        {"type": "unread", "room_id": room.id, "message_id": message_id, "delta": 1},
+        exclude_room=str(room.id),
+        exclude_user=sender_id
+    )
+
 @app.post("/api/rooms", response_model=schemas.RoomResponse)
-async def create_room(room_data: schemas.RoomCreate, admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def create_room(room_data: schemas.RoomCreate, admin: UserPrincipal = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
     new_room = models.Room(**room_data.dict())
     db.add(new_room)
-    db.commit()
-    db.refresh(new_room)
+    await db.commit()
+    await db.refresh(new_room)
+    await registry.put_room(new_room)
+    await room_list_cache.clear()
     return new_room
 
 @app.get("/api/reset-admin-temp")
-async def reset_admin_temp(db: Session = Depends(get_db)):
+async def reset_admin_temp(db: AsyncSession = Depends(get_db)):
     """임시 관리자 비밀번호 변경 API - 사용 후 삭제할 것!"""
-    admin = db.query(models.User).filter(models.User.role == "admin").first()
+    admin = await db.scalar(select(models.User).where(models.User.role == "admin"))
     if admin:
         admin.phone = "010-6512-6542"
-        admin.password = get_password_hash("Rlawnsghl1!")
+        admin.password = await get_password_hash("Rlawnsghl1!")
         admin.name = "일타교장쌤"
-        db.commit()
+        await db.commit()
+        await user_cache.invalidate(admin.id)
         return {"message": "관리자 변경 완료!", "phone": "010-6512-6542", "name": "일타교장쌤"}
     return {"message": "관리자를 찾을 수 없습니다"}
 
@@ -412,11 +491,11 @@ async def reset_admin_temp(db: Session = Depends(get_db)):
 async def update_room(
     room_id: int,
     room_data: schemas.RoomCreate,
-    admin: models.User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin: UserPrincipal = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """채팅방 수정 (관리자 전용)"""
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
+    room = await db.scalar(select(models.Room).where(models.Room.id == room_id))
     if not room:
         raise HTTPException(status_code=404, detail="채팅방을 찾을 수 없습니다")
     
@@ -425,41 +504,61 @@ async def update_room(
     room.is_free = room_data.is_free
     room.description = room_data.description
     
-    db.commit()
-    db.refresh(room)
+    await db.commit()
+    await db.refresh(room)
+    await registry.put_room(room)
+    await room_list_cache.clear()
     
     return room
 
 @app.delete("/api/admin/rooms/{room_id}")
 async def delete_room(
     room_id: int,
-    admin: models.User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin: UserPrincipal = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """채팅방 삭제 (관리자 전용) - 메시지도 함께 삭제"""
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
+    room = await db.scalar(select(models.Room).where(models.Room.id == room_id))
     if not room:
         raise HTTPException(status_code=404, detail="채팅방을 찾을 수 없습니다")
     
-    # 채팅방의 모든 메시지 삭제
-    db.query(models.Message).filter(models.Message.room_id == room_id).delete()
+    # 채팅방의 모든 메시지 삭제 (저장 대기 중인 메시지 먼저 반영)
+    await message_writer.flush()
+    file_urls = (await db.scalars(
+        select(models.Message.file_url).where(models.Message.room_id == room_id, models.Message.file_url.is_not(None)).distinct()
+    )).all()
+    await db.execute(delete(models.Message).where(models.Message.room_id == room_id))
     
     # 채팅방 삭제
-    db.delete(room)
-    db.commit()
+    await db.delete(room)
+    await db.commit()
+    await message_cache.drop(room_id)
+    await unread_counter.drop(room_id)
+    await registry.remove_room(room_id)
+    await manager.drop_room(str(room_id))
+    await room_list_cache.clear()
+    # 다른 방에서 쓰지 않는 업로드 파일 정리
+    await upload_store.collect(file_urls)
     
     return {"message": "채팅방이 삭제되었습니다"}
 
 @app.get("/api/rooms/{room_id}/messages", response_model=List[schemas.MessageResponse])
 async def get_room_messages(
     room_id: int,
-    db: Session = Depends(get_db),
-    current_user: Optional[models.User] = Depends(get_current_user_optional)
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_MAX),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[UserPrincipal] = Depends(get_current_user_optional)
 ):
-    """채팅방 메시지 조회"""
-    from sqlalchemy.orm import joinedload
-    
-    room = db.query(models.Room).filter(models.Room.id == room_id).first()
+    """채팅방 메시지 조회 (오래된 순)
+
+    - 커서 없음: 최근 limit개
+    - before_id: 그보다 오래된 limit개 (위로 스크롤)
+    - after_id: 그 이후 limit개 (재연결 후 따라잡기), before_id와 같이 쓰면 그 사이
+    OFFSET 없이 (room_id, id) 인덱스로 찾으므로 얼마나 뒤로 가든 비용이 같다.
+    """
+    room = registry.get_room(room_id)
     if not room:
         raise HTTPException(status_code=404, detail="채팅방을 찾을 수 없습니다")
     
@@ -467,29 +566,70 @@ async def get_room_messages(
     if not room.is_free and not current_user:
         raise HTTPException(status_code=401, detail="로그인이 필요합니다")
     
-    # user 정보를 함께 로드
-    messages = db.query(models.Message).options(
-        joinedload(models.Message.user)
-    ).filter(
-        models.Message.room_id == room_id
-    ).order_by(models.Message.created_at.desc()).limit(50).all()
+    if before_id is None and after_id is None and message_cache.begin_load(room_id):
+        # 최근 메시지를 캐시에 채움 (user 정보 포함, 삭제 대비 여유분까지)
+        try:
+            await message_writer.flush()
+            messages = (await db.scalars(select(models.Message).options(
+                joinedload(models.Message.user)
+            ).where(
+                models.Message.room_id == room_id
+            ).order_by(models.Message.id.desc()).limit(message_cache.capacity))).all()
+            loaded = [serialize_message(msg, msg.user) for msg in reversed(messages)]
+        except BaseException:
+            message_cache.cancel_load(room_id)
+            raise
+        message_cache.load(room_id, loaded)
+    
+    if current_user is None and before_id is None and after_id is None and limit == MESSAGE_PAGE_SIZE:
+        # 비로그인(무료방) 최근 페이지는 인코딩된 캐시를 그대로 반환
+        page = message_cache.get_page(room_id)
+        if page is not None:
+            return Response(content=page, media_type="application/json")
+    
+    # 캐시된 범위 안이면 DB 조회 없이
+    items = message_cache.get_range(room_id, before_id, after_id, limit)
+    if items is None:
+        await message_writer.flush()
+        query = select(models.Message).options(joinedload(models.Message.user)).where(models.Message.room_id == room_id)
+        if after_id is not None:
+            query = query.where(models.Message.id > after_id)
+            if before_id is not None:
+                query = query.where(models.Message.id < before_id)
+            messages = (await db.scalars(query.order_by(models.Message.id.asc()).limit(limit))).all()
+        else:
+            if before_id is not None:
+                query = query.where(models.Message.id < before_id)
+            messages = list(reversed((await db.scalars(query.order_by(models.Message.id.desc()).limit(limit))).all()))
+        items = [serialize_message(msg, msg.user) for msg in messages]
+    
+    if current_user is not None:
+        # 페이지 전체의 내 리액션을 쿼리 한 번으로
+        mine = await get_my_reactions(db, current_user.id, [item["id"] for item in items])
+        items = [{**item, "my_reactions": mine.get(item["id"], [])} for item in items]
     
-    return messages[::-1]
+    return Response(content=dumps(items), media_type="application/json")
 
 # ==================== 메시지 삭제 API ====================
 
 @app.delete("/api/messages/{message_id}")
-async def delete_message(message_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_message(message_id: int, current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     if current_user.role not in ["admin", "subadmin", "staff"]:
         raise HTTPException(status_code=403, detail="메시지 삭제 권한이 없습니다")
     
-    message = db.query(models.Message).filter(models.Message.id == message_id).first()
+    await message_writer.flush()
+    message = await db.scalar(select(models.Message).where(models.Message.id == message_id))
     if not message:
         raise HTTPException(status_code=404, detail="메시지를 찾을 수 없습니다")
     
     room_id = message.room_id
-    db.delete(message)
-    db.commit()
+    file_url = message.file_url
+    await db.delete(message)
+    await db.commit()
+    await message_cache.remove(room_id, message_id)
+    await unread_counter.remove(room_id, message_id)
+    if file_url:
+        await upload_store.collect([file_url])
     
     # WebSocket으로 삭제 이벤트 브로드캐스트
     await manager.send_message({
@@ -505,167 +645,225 @@ async def delete_message(message_id: int, current_user: models.User = Depends(ge
 async def toggle_reaction(
     message_id: int,
     reaction_type: str,  # 'heart' or 'thumbsup'
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """메시지에 리액션 추가/제거 (토글)"""
     if reaction_type not in ['heart', 'thumbsup']:
         raise HTTPException(status_code=400, detail="잘못된 리액션 타입입니다")
     
     # 메시지 존재 확인
-    message = db.query(models.Message).filter(models.Message.id == message_id).first()
+    message = await db.scalar(select(models.Message).where(models.Message.id == message_id))
     if not message:
         raise HTTPException(status_code=404, detail="메시지를 찾을 수 없습니다")
     
-    # 기존 리액션 확인
-    existing = db.query(MessageReaction).filter(
+    # 리액션 행과 메시지의 리액션 수를 같은 트랜잭션에서 갱신
+    counter = getattr(models.Message, f"{reaction_type}_count")
+    removed = await db.execute(delete(MessageReaction).where(
         MessageReaction.message_id == message_id,
         MessageReaction.user_id == current_user.id,
         MessageReaction.reaction_type == reaction_type
-    ).first()
-    
-    if existing:
-        # 이미 있으면 제거 (토글)
-        db.delete(existing)
-        db.commit()
+    ))
+    if removed.rowcount:
+        # 이미 있었으면 제거 (토글)
+        await db.execute(update(models.Message).where(models.Message.id == message_id).values({counter: counter - 1}))
+        await db.commit()
         action = "removed"
     else:
         # 없으면 추가
-        new_reaction = MessageReaction(
-            message_id=message_id,
-            user_id=current_user.id,
-            reaction_type=reaction_type
-        )
-        db.add(new_reaction)
-        db.commit()
         action = "added"
+        try:
+            db.add(MessageReaction(
+                message_id=message_id,
+                user_id=current_user.id,
+                reaction_type=reaction_type
+            ))
+            await db.execute(update(models.Message).where(models.Message.id == message_id).values({counter: counter + 1}))
+            await db.commit()
+        except IntegrityError:
+            # 동시에 같은 리액션이 추가됨 - 이미 반영되어 있음
+            await db.rollback()
     
     # 현재 리액션 카운트 조회
-    counts = get_reaction_counts(db, message_id)
+    counts = await get_reaction_counts(db, message_id)
+    await message_cache.set_reactions(message.room_id, message_id, counts)
     
-    # WebSocket으로 리액션 업데이트 브로드캐스트
-    await manager.send_message({
+    # WebSocket으로 리액션 업데이트 브로드캐스트 (메시지별로 짧게 모아서 마지막 카운트만)
+    await reaction_broadcaster.publish(str(message.room_id), {
         "type": "reaction",
         "message_id": message_id,
         "reaction_type": reaction_type,
         "action": action,
         "counts": counts,
         "user_id": current_user.id
-    }, str(message.room_id))
+    })
     
     return {"success": True, "action": action, "counts": counts}
 
+@app.get("/api/messages/reactions")
+async def get_reactions_bulk(
+    ids: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[UserPrincipal] = Depends(get_current_user_optional)
+):
+    """여러 메시지의 리액션 조회 (ids=1,2,3). 로그인한 경우 내 리액션(mine) 포함
+
+    {message_id: {"heart": n, "thumbsup": n, "mine": [...]}}
+    """
+    try:
+        message_ids = list({int(part) for part in ids.split(",") if part})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="잘못된 메시지 id입니다")
+    if len(message_ids) > MESSAGE_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"한 번에 {MESSAGE_PAGE_MAX}개까지 조회할 수 있습니다")
+    
+    rows = (await db.execute(
+        select(models.Message.id, models.Message.heart_count, models.Message.thumbsup_count)
+        .where(models.Message.id.in_(message_ids))
+    )).all() if message_ids else []
+    result = {message_id: {"heart": heart or 0, "thumbsup": thumbsup or 0} for message_id, heart, thumbsup in rows}
+    if current_user is not None:
+        mine = await get_my_reactions(db, current_user.id, list(result))
+        for message_id, counts in result.items():
+            counts["mine"] = mine.get(message_id, [])
+    return result
+
 @app.get("/api/messages/{message_id}/reactions")
-async def get_reactions(message_id: int, db: Session = Depends(get_db)):
+async def get_reactions(message_id: int, db: AsyncSession = Depends(get_db)):
     """메시지 리액션 조회"""
-    counts = get_reaction_counts(db, message_id)
+    counts = await get_reaction_counts(db, message_id)
     return counts
 
-def get_reaction_counts(db: Session, message_id: int):
-    """리액션 카운트 헬퍼 함수"""
-    heart_count = db.query(MessageReaction).filter(
-        MessageReaction.message_id == message_id,
-        MessageReaction.reaction_type == "heart"
-    ).count()
-    
-    thumbsup_count = db.query(MessageReaction).filter(
-        MessageReaction.message_id == message_id,
-        MessageReaction.reaction_type == "thumbsup"
-    ).count()
-    
-    return {"heart": heart_count, "thumbsup": thumbsup_count}
+async def get_reaction_counts(db: AsyncSession, message_id: int):
+    """리액션 카운트 헬퍼 함수 (messages의 리액션 수 컬럼)"""
+    row = (await db.execute(
+        select(models.Message.heart_count, models.Message.thumbsup_count).where(models.Message.id == message_id)
+    )).first()
+    if row is None:
+        return {"heart": 0, "thumbsup": 0}
+    return {"heart": row.heart_count or 0, "thumbsup": row.thumbsup_count or 0}
+
+async def get_my_reactions(db: AsyncSession, user_id: int, message_ids: list) -> dict:
+    """사용자가 누른 리액션 {message_id: [reaction_type, ...]}"""
+    if not message_ids:
+        return {}
+    rows = (await db.execute(
+        select(MessageReaction.message_id, MessageReaction.reaction_type).where(
+            MessageReaction.user_id == user_id,
+            MessageReaction.message_id.in_(message_ids)
+        )
+    )).all()
+    mine = {}
+    for message_id, reaction_type in rows:
+        mine.setdefault(message_id, []).append(reaction_type)
+    return mine
 
 # ==================== 파일 업로드 API ====================
 
 @app.post("/api/upload/image")
-async def upload_image(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
+async def upload_image(file: UploadFile = File(...), current_user: UserPrincipal = Depends(get_current_user)):
     allowed = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
     ext = os.path.splitext(file.filename)[1].lower()
     
     if ext not in allowed:
         raise HTTPException(status_code=400, detail="지원하지 않는 이미지 형식입니다")
     
-    contents = await file.read()
-    if len(contents) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="파일 크기는 5MB 이하여야 합니다")
-    
-    filename = f"{uuid.uuid4()}{ext}"
-    filepath = UPLOAD_DIR / filename
+    filename = await upload_store.save(file, ext, IMAGE_MAX_BYTES, IMAGE_TOO_LARGE)
     
-    with open(filepath, "wb") as f:
-        f.write(contents)
+    # 썸네일/WebP 파생본은 백그라운드에서 생성 - 끝나기 전에 요청이 오면 UploadFiles가 그 작업을 기다림
+    image_processor.schedule(filename)
+    variants = image_processor.variant_urls(filename)
     
-    return {"url": f"/uploads/{filename}", "filename": file.filename, "type": "image"}
+    return {"url": f"/uploads/{filename}", "filename": file.filename, "type": "image", "variants": variants}
 
 @app.post("/api/upload/file")
-async def upload_file(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
+async def upload_file(file: UploadFile = File(...), current_user: UserPrincipal = Depends(get_current_user)):
     allowed = {".pdf", ".doc", ".docx", ".xls", ".xlsx", ".txt", ".zip"}
     ext = os.path.splitext(file.filename)[1].lower()
     
     if ext not in allowed:
         raise HTTPException(status_code=400, detail="지원하지 않는 파일 형식입니다")
     
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="파일 크기는 10MB 이하여야 합니다")
-    
-    filename = f"{uuid.uuid4()}{ext}"
-    filepath = UPLOAD_DIR / filename
-    
-    with open(filepath, "wb") as f:
-        f.write(contents)
+    filename = await upload_store.save(file, ext, FILE_MAX_BYTES, FILE_TOO_LARGE)
     
     return {"url": f"/uploads/{filename}", "filename": file.filename, "type": "file"}
 
 # ==================== WebSocket ====================
 
 @app.websocket("/ws/chat/{room_id}")
-async def websocket_chat(websocket: WebSocket, room_id: int, token: str):
-    """채팅 WebSocket"""
-    db = SessionLocal()
+async def websocket_chat(websocket: WebSocket, room_id: int, token: str, last_seq: Optional[int] = None, epoch: Optional[str] = None):
+    """채팅 WebSocket (재연결 시 last_seq, epoch를 보내면 놓친 이벤트만 재전송)"""
+    db = AsyncSessionLocal()
     user_id = None
     user = None
+    connection = None
     
     try:
         # 토큰 검증
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         
-        user = db.query(models.User).filter(models.User.id == user_id).first()
+        user = await db.scalar(select(models.User).where(models.User.id == user_id))
         if not user or not user.is_approved:
             await websocket.close(code=1008)
             return
         
-        room = db.query(models.Room).filter(models.Room.id == room_id).first()
+        room = registry.get_room(room_id)
         if not room:
             await websocket.close(code=1008)
             return
         
-        await manager.connect(websocket, str(room_id), user_id, user.name, user.role)
+        # 연결이 유지되는 동안 읽기 트랜잭션(커넥션)을 잡고 있지 않도록 종료
+        await db.commit()
+        
+        connection = await manager.connect(websocket, str(room_id), user.id, user.name, user.role, last_seq, epoch)
         
         while True:
             data = await websocket.receive_json()
             
+            # 읽음 확인 {"type": "read", "room_id": 방 (기본: 이 방), "message_id": 마지막으로 본 id (기본: 최신)}
+            if data.get("type") == "read":
+                try:
+                    read_room_id = int(data.get("room_id") or room_id)
+                    read_message_id = int(data["message_id"]) if data.get("message_id") is not None else None
+                except (TypeError, ValueError):
+                    continue
+                if not can_read_room(user, registry.get_room(read_room_id)):
+                    continue
+                await acknowledge_read(db, user.id, read_room_id, read_message_id, connection)
+                await db.commit()
+                continue
+            
             # 일반 회원은 메시지 전송 불가
             if user.role == "member":
-                await websocket.send_json({
+                connection.send_json({
                     "type": "error",
                     "message": "관리자와 직원만 메시지를 보낼 수 있습니다."
                 })
                 continue
             
             # 메시지 저장
-            message = models.Message(
-                room_id=room_id,
-                user_id=user_id,
-                content=data.get("message"),
-                message_type=data.get("type", "text"),
-                file_url=data.get("file_url"),
-                file_name=data.get("file_name")
-            )
-            db.add(message)
-            db.commit()
-            db.refresh(message)
+            try:
+                message = await message_writer.save(
+                    db,
+                    room_id=room_id,
+                    user_id=user_id,
+                    content=data.get("message"),
+                    message_type=data.get("type", "text"),
+                    file_url=data.get("file_url"),
+                    file_name=data.get("file_name")
+                )
+            except ValueError:
+                connection.send_json({
+                    "type": "error",
+                    "message": "메시지 내용이 없습니다."
+                })
+                continue
+            # sync 모드의 refresh가 연 읽기 트랜잭션을 다음 프레임까지 잡고 있지 않도록 종료
+            await db.commit()
+            await message_cache.add(room_id, serialize_message(message, user))
+            await unread_counter.add(room_id, message.id)
+            await notify_unread(room, message.id, user.id)
             
             # 브로드캐스트
             await manager.send_message({
@@ -679,21 +877,22 @@ async def websocket_chat(websocket: WebSocket, room_id: int, token: str):
                 "message_type": message.message_type,
                 "file_url": message.file_url,
                 "file_name": message.file_name,
+                "variants": image_processor.urls_for(message.file_url) if message.message_type == "image" else None,
                 "timestamp": message.created_at.isoformat()
             }, str(room_id))
             
     except WebSocketDisconnect:
-        if user_id and user:
-            manager.disconnect(websocket, str(room_id), user_id)
+        if connection:
+            manager.disconnect(connection)
     except jwt.PyJWTError as e:
         print(f"WebSocket JWT error: {e}")
         await websocket.close(code=1008)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        if user_id and user:
-            manager.disconnect(websocket, str(room_id), user_id)
+        if connection:
+            manager.disconnect(connection)
     finally:
-        db.close()
+        await db.close()
 
 # ==================== 시장 분석 API (MT4 기반) ====================
 
@@ -859,6 +1058,7 @@ async def update_market_data(request: Request):
     market_analysis_cache['data'] = data_list
     market_analysis_cache['updated_at'] = datetime.now()
     market_analysis_cache['source'] = 'mt4'
+    await market_response_cache.clear()
     
     print(f"MT4 data received: {len(data_list)} symbols")
     for item in data_list:
@@ -871,10 +1071,18 @@ async def update_market_data(request: Request):
     }
 
 @app.get("/api/market/analysis")
-async def get_market_analysis():
-    """Get market analysis data"""
-    global market_analysis_cache
-    
+async def get_market_analysis(request: Request):
+    """Get market analysis data (MT4 업데이트 때까지 인코딩된 응답 재사용)"""
+    cached = market_response_cache.get("analysis")
+    if cached is None:
+        body = dumps(build_market_analysis())
+        cached = (body, make_etag(body))
+        market_response_cache.put("analysis", cached)
+    body, etag = cached
+    return cached_json_response(request, body, etag)
+
+def build_market_analysis() -> dict:
+    """시장 분석 응답 (30분 이내 MT4 데이터, 없으면 폴백)"""
     # 데이터가 있고 30분 이내면 반환
     if market_analysis_cache['data'] and market_analysis_cache['updated_at']:
         cache_age = datetime.now() - market_analysis_cache['updated_at']
@@ -897,7 +1105,7 @@ async def get_market_analysis():
     }
 
 @app.post("/api/market/refresh")
-async def refresh_market_analysis(current_user: models.User = Depends(get_current_user)):
+async def refresh_market_analysis(current_user: UserPrincipal = Depends(get_current_user)):
     """Manual refresh request (admin only) - Updated by MT4 EA"""
     if current_user.role != 'admin':
         raise HTTPException(status_code=403, detail="Admin only")
@@ -946,7 +1154,7 @@ async def receive_mt4_signal(
     entry_price: float = 0,  # 종료 시 진입가
     profit: float = 0,  # 종료 시 수익
     api_key: str = "",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """MT4에서 시그널 수신"""
     # API Key 검증 임시 비활성화 (테스트용)
@@ -955,11 +1163,7 @@ async def receive_mt4_signal(
     #     raise HTTPException(status_code=403, detail="Invalid API key")
     
     # 해외선물 리딩방 찾기 (room_id=3 또는 room_type 검색)
-    room = db.query(models.Room).filter(models.Room.id == 3).first()
-    if not room:
-        room = db.query(models.Room).filter(models.Room.room_type == "futures").first()
-    if not room:
-        room = db.query(models.Room).filter(models.Room.room_type == "해외선물").first()
+    room = registry.get_room(3) or registry.find_room_by_type("futures") or registry.find_room_by_type("해외선물")
     if not room:
         raise HTTPException(status_code=404, detail="해외선물 채팅방을 찾을 수 없습니다")
     
@@ -1010,17 +1214,18 @@ async def receive_mt4_signal(
 💰 가격: {price}"""
     
     # 관리자 ID로 메시지 저장
-    admin = db.query(models.User).filter(models.User.role == "admin").first()
+    admin = await db.scalar(select(models.User).where(models.User.role == "admin"))
     
-    message = models.Message(
+    message = await message_writer.save(
+        db,
         room_id=room.id,
         user_id=admin.id if admin else 1,
         content=content,
         message_type="signal"
     )
-    db.add(message)
-    db.commit()
-    db.refresh(message)
+    await message_cache.add(room.id, serialize_message(message, admin))
+    await unread_counter.add(room.id, message.id)
+    await notify_unread(room, message.id, message.user_id)
     
     # WebSocket으로 실시간 전송 (일반 채팅과 동일한 형식)
     await manager.send_message({
@@ -1037,11 +1242,11 @@ async def receive_mt4_signal(
     return {"success": True, "message": "시그널이 전송되었습니다"}
 
 @app.post("/api/mt4/position")
-async def receive_mt4_position(position_data: schemas.MT4Position, api_key: str, db: Session = Depends(get_db)):
+async def receive_mt4_position(position_data: schemas.MT4Position, api_key: str, db: AsyncSession = Depends(get_db)):
     if api_key != "your-mt4-api-key":
         raise HTTPException(status_code=403, detail="Invalid API key")
     
-    room = db.query(models.Room).filter(models.Room.room_type == "futures").first()
+    room = registry.find_room_by_type("futures")
     if not room:
         raise HTTPException(status_code=404, detail="해외선물 채팅방을 찾을 수 없습니다")
     
@@ -1055,14 +1260,16 @@ async def receive_mt4_position(position_data: schemas.MT4Position, api_key: str,
 목표가: {position_data.tp}
 시간: {position_data.open_time}"""
     
-    message = models.Message(
+    message = await message_writer.save(
+        db,
         room_id=room.id,
         user_id=1,
         content=content,
         message_type="signal"
     )
-    db.add(message)
-    db.commit()
+    await message_cache.add(room.id, serialize_message(message, await db.get(models.User, 1)))
+    await unread_counter.add(room.id, message.id)
+    await notify_unread(room, message.id, message.user_id)
     
     await manager.send_message({
         "type": "signal",
@@ -1075,13 +1282,13 @@ async def receive_mt4_position(position_data: schemas.MT4Position, api_key: str,
 # ==================== URL 미리보기 API ====================
 
 @app.get("/api/link-preview")
-async def get_link_preview(url: str, db: Session = Depends(get_db)):
+async def get_link_preview(url: str, db: AsyncSession = Depends(get_db)):
     """URL의 OG 메타데이터 가져오기 (캐시 사용)"""
     import aiohttp
     from bs4 import BeautifulSoup
     
     # 1. 캐시 확인 (빈 캐시는 무시)
-    cached = db.query(models.LinkPreviewCache).filter(models.LinkPreviewCache.url == url).first()
+    cached = await db.scalar(select(models.LinkPreviewCache).where(models.LinkPreviewCache.url == url))
     if cached and cached.title:  # title이 있는 경우에만 캐시 사용
         return {
             "url": url,
@@ -1092,8 +1299,8 @@ async def get_link_preview(url: str, db: Session = Depends(get_db)):
     
     # 빈 캐시가 있으면 삭제
     if cached and not cached.title:
-        db.delete(cached)
-        db.commit()
+        await db.delete(cached)
+        await db.commit()
     
     # 2. 캐시 없으면 크롤링
     try:
@@ -1134,7 +1341,7 @@ async def get_link_preview(url: str, db: Session = Depends(get_db)):
                         image=image[:500] if image else ""
                     )
                     db.add(new_cache)
-                    db.commit()
+                    await db.commit()
                 
                 return {
                     "url": url,
@@ -1148,19 +1355,19 @@ async def get_link_preview(url: str, db: Session = Depends(get_db)):
 
 @app.delete("/api/admin/link-preview-cache")
 async def clear_link_preview_cache(
-    admin: models.User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin: UserPrincipal = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """링크 미리보기 캐시 전체 삭제 (관리자 전용)"""
-    count = db.query(models.LinkPreviewCache).count()
-    db.query(models.LinkPreviewCache).delete()
-    db.commit()
+    count = await db.scalar(select(func.count(models.LinkPreviewCache.id)))
+    await db.execute(delete(models.LinkPreviewCache))
+    await db.commit()
     return {"message": f"링크 미리보기 캐시 {count}개가 삭제되었습니다"}
 
 # ==================== 뉴스 API ====================
 
 @app.get("/api/news/{category}")
-async def get_news(category: str, current_user: models.User = Depends(get_current_user)):
+async def get_news(category: str, current_user: UserPrincipal = Depends(get_current_user)):
     from news_crawler import crawl_news
     try:
         news_list = await crawl_news(category)
@@ -1170,66 +1377,106 @@ async def get_news(category: str, current_user: models.User = Depends(get_curren
 
 # ==================== 쓰레드(게시판) API ====================
 
-@app.get("/api/threads", response_model=List[schemas.ThreadResponse])
-async def get_threads(db: Session = Depends(get_db)):
-    """쓰레드 목록 조회 (활성화된 것만, 고정글 우선)"""
-    from sqlalchemy.orm import joinedload
-    from sqlalchemy import func
-    
-    threads = db.query(models.Thread).options(
-        joinedload(models.Thread.author)
-    ).filter(
-        models.Thread.is_active == True
-    ).order_by(
-        models.Thread.is_pinned.desc(),
-        models.Thread.created_at.desc()
-    ).all()
-    
-    # 댓글 수 추가
-    result = []
-    for thread in threads:
-        comment_count = db.query(func.count(models.ThreadComment.id)).filter(
-            models.ThreadComment.thread_id == thread.id
-        ).scalar()
+THREAD_PAGE_MAX = 100
+
+def serialize_thread(thread: models.Thread, comment_count: int, summary: bool = False) -> dict:
+    """쓰레드 목록 캐시용 dict (schemas.ThreadResponse 형식, summary면 본문 제외)"""
+    data = {
+        "id": thread.id,
+        "title": thread.title,
+        "author_id": thread.author_id,
+        "is_pinned": thread.is_pinned,
+        "is_active": thread.is_active,
+        "view_count": view_counter.get(thread.id, thread.view_count),
+        "created_at": thread.created_at.isoformat(),
+        "updated_at": thread.updated_at.isoformat(),
+        "author": {"id": thread.author.id, "name": thread.author.name, "role": thread.author.role} if thread.author else None,
+        "comment_count": comment_count
+    }
+    if not summary:
+        data["content"] = thread.content
+    return data
+
+@app.get("/api/threads", response_model=List[schemas.ThreadListItemResponse])
+async def get_threads(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=THREAD_PAGE_MAX),
+    summary: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """쓰레드 목록 조회 (활성화된 것만, 고정글 우선, 최신순)
+
+    - limit: 페이지 크기 (없으면 전체). 다음 페이지가 있으면 X-Next-Cursor 헤더로 커서 전달
+    - cursor: 이전 응답의 X-Next-Cursor
+    - summary: true면 본문(content) 제외
+    댓글 수는 같은 쿼리의 서브쿼리로 계산하고, 직렬화된 응답은 쓰레드/댓글이 바뀔 때까지 캐시
+    """
+    key = (cursor, limit, summary)
+    cached = thread_list_cache.get(key)
+    if cached is None:
+        generation = thread_list_cache.generation
+        comment_count = select(func.count(models.ThreadComment.id)).where(
+            models.ThreadComment.thread_id == models.Thread.id
+        ).correlate(models.Thread).scalar_subquery()
         
-        thread_dict = {
-            "id": thread.id,
-            "title": thread.title,
-            "content": thread.content,
-            "author_id": thread.author_id,
-            "is_pinned": thread.is_pinned,
-            "is_active": thread.is_active,
-            "view_count": thread.view_count,
-            "created_at": thread.created_at,
-            "updated_at": thread.updated_at,
-            "author": thread.author,
-            "comment_count": comment_count
-        }
-        result.append(thread_dict)
+        query = select(models.Thread, comment_count).options(
+            joinedload(models.Thread.author)
+        ).where(
+            models.Thread.is_active == True
+        ).order_by(
+            models.Thread.is_pinned.desc(),
+            models.Thread.id.desc()
+        )
+        if summary:
+            query = query.options(defer(models.Thread.content))
+        if cursor:
+            # 커서: "고정여부:마지막 id"
+            try:
+                pinned, last_id = (int(part) for part in cursor.split(":"))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="잘못된 커서입니다")
+            if pinned:
+                query = query.where(or_(
+                    models.Thread.is_pinned == False,
+                    and_(models.Thread.is_pinned == True, models.Thread.id < last_id)
+                ))
+            else:
+                query = query.where(models.Thread.is_pinned == False, models.Thread.id < last_id)
+        if limit:
+            query = query.limit(limit + 1)
+        
+        rows = (await db.execute(query)).all()
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1][0]
+            next_cursor = f"{int(bool(last.is_pinned))}:{last.id}"
+        
+        body = dumps([serialize_thread(thread, count, summary) for thread, count in rows])
+        cached = (body, make_etag(body), next_cursor)
+        thread_list_cache.put(key, cached, generation)
     
-    return result
+    body, etag, next_cursor = cached
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return cached_json_response(request, body, etag, headers=headers)
 
 @app.get("/api/threads/{thread_id}", response_model=schemas.ThreadResponse)
-async def get_thread(thread_id: int, db: Session = Depends(get_db)):
-    """쓰레드 상세 조회 (조회수 증가)"""
-    from sqlalchemy.orm import joinedload
-    from sqlalchemy import func
-    
-    thread = db.query(models.Thread).options(
+async def get_thread(thread_id: int, db: AsyncSession = Depends(get_db)):
+    """쓰레드 상세 조회 (조회수 증가 - DB에는 view_counter가 모아서 저장)"""
+    thread = await db.scalar(select(models.Thread).options(
         joinedload(models.Thread.author)
-    ).filter(models.Thread.id == thread_id).first()
+    ).where(models.Thread.id == thread_id))
     
     if not thread:
         raise HTTPException(status_code=404, detail="쓰레드를 찾을 수 없습니다")
     
-    # 조회수 증가
-    thread.view_count += 1
-    db.commit()
+    view_counter.add(thread.id)
     
     # 댓글 수
-    comment_count = db.query(func.count(models.ThreadComment.id)).filter(
+    comment_count = await db.scalar(select(func.count(models.ThreadComment.id)).where(
         models.ThreadComment.thread_id == thread.id
-    ).scalar()
+    ))
     
     return {
         "id": thread.id,
@@ -1238,7 +1485,7 @@ async def get_thread(thread_id: int, db: Session = Depends(get_db)):
         "author_id": thread.author_id,
         "is_pinned": thread.is_pinned,
         "is_active": thread.is_active,
-        "view_count": thread.view_count,
+        "view_count": view_counter.get(thread.id, thread.view_count),
         "created_at": thread.created_at,
         "updated_at": thread.updated_at,
         "author": thread.author,
@@ -1248,8 +1495,8 @@ async def get_thread(thread_id: int, db: Session = Depends(get_db)):
 @app.post("/api/admin/threads", response_model=schemas.ThreadResponse)
 async def create_thread(
     thread_data: schemas.ThreadCreate,
-    admin: models.User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin: UserPrincipal = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """쓰레드 생성 (관리자 전용)"""
     new_thread = models.Thread(
@@ -1259,10 +1506,10 @@ async def create_thread(
         is_pinned=thread_data.is_pinned
     )
     db.add(new_thread)
-    db.commit()
-    db.refresh(new_thread)
+    await db.commit()
+    await db.refresh(new_thread)
+    await thread_list_cache.clear()
     
-    new_thread.author = admin
     return {
         "id": new_thread.id,
         "title": new_thread.title,
@@ -1273,7 +1520,7 @@ async def create_thread(
         "view_count": new_thread.view_count,
         "created_at": new_thread.created_at,
         "updated_at": new_thread.updated_at,
-        "author": new_thread.author,
+        "author": admin,
         "comment_count": 0
     }
 
@@ -1281,11 +1528,11 @@ async def create_thread(
 async def update_thread(
     thread_id: int,
     thread_data: schemas.ThreadUpdate,
-    admin: models.User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin: UserPrincipal = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """쓰레드 수정 (관리자 전용)"""
-    thread = db.query(models.Thread).filter(models.Thread.id == thread_id).first()
+    thread = await db.scalar(select(models.Thread).where(models.Thread.id == thread_id))
     if not thread:
         raise HTTPException(status_code=404, detail="쓰레드를 찾을 수 없습니다")
     
@@ -1298,39 +1545,41 @@ async def update_thread(
     if thread_data.is_active is not None:
         thread.is_active = thread_data.is_active
     
-    db.commit()
-    db.refresh(thread)
+    await db.commit()
+    await thread_list_cache.clear()
+    await db.refresh(thread)
+    # 응답 직렬화 때 lazy load가 일어나지 않도록 작성자도 미리 로드
+    await db.refresh(thread, ["author"])
     
     return thread
 
 @app.delete("/api/admin/threads/{thread_id}")
 async def delete_thread(
     thread_id: int,
-    admin: models.User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin: UserPrincipal = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """쓰레드 삭제 (관리자 전용)"""
-    thread = db.query(models.Thread).filter(models.Thread.id == thread_id).first()
+    thread = await db.scalar(select(models.Thread).where(models.Thread.id == thread_id))
     if not thread:
         raise HTTPException(status_code=404, detail="쓰레드를 찾을 수 없습니다")
     
-    db.delete(thread)
-    db.commit()
+    await db.delete(thread)
+    await db.commit()
+    await thread_list_cache.clear()
     
     return {"message": "쓰레드가 삭제되었습니다"}
 
 # ==================== 쓰레드 댓글 API ====================
 
 @app.get("/api/threads/{thread_id}/comments", response_model=List[schemas.ThreadCommentResponse])
-async def get_thread_comments(thread_id: int, db: Session = Depends(get_db)):
+async def get_thread_comments(thread_id: int, db: AsyncSession = Depends(get_db)):
     """쓰레드 댓글 목록 조회"""
-    from sqlalchemy.orm import joinedload
-    
-    comments = db.query(models.ThreadComment).options(
+    comments = (await db.scalars(select(models.ThreadComment).options(
         joinedload(models.ThreadComment.user)
-    ).filter(
+    ).where(
         models.ThreadComment.thread_id == thread_id
-    ).order_by(models.ThreadComment.created_at.asc()).all()
+    ).order_by(models.ThreadComment.created_at.asc()))).all()
     
     return comments
 
@@ -1338,8 +1587,8 @@ async def get_thread_comments(thread_id: int, db: Session = Depends(get_db)):
 async def create_thread_comment(
     thread_id: int,
     comment_data: schemas.ThreadCommentCreate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """쓰레드 댓글 작성 (승인된 회원 + 관리자/스태프)"""
     # 승인된 사용자 또는 관리자/스태프인지 확인
@@ -1347,7 +1596,7 @@ async def create_thread_comment(
         raise HTTPException(status_code=403, detail="승인된 회원만 댓글을 작성할 수 있습니다")
     
     # 쓰레드 존재 여부 확인
-    thread = db.query(models.Thread).filter(models.Thread.id == thread_id).first()
+    thread = await db.scalar(select(models.Thread).where(models.Thread.id == thread_id))
     if not thread:
         raise HTTPException(status_code=404, detail="쓰레드를 찾을 수 없습니다")
     
@@ -1361,20 +1610,27 @@ async def create_thread_comment(
         content=comment_data.content
     )
     db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    await db.commit()
+    await db.refresh(new_comment)
+    await thread_list_cache.clear()  # 목록의 댓글 수 갱신
     
-    new_comment.user = current_user
-    return new_comment
+    return {
+        "id": new_comment.id,
+        "thread_id": new_comment.thread_id,
+        "user_id": new_comment.user_id,
+        "content": new_comment.content,
+        "created_at": new_comment.created_at,
+        "user": current_user
+    }
 
 @app.delete("/api/threads/comments/{comment_id}")
 async def delete_thread_comment(
     comment_id: int,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """쓰레드 댓글 삭제 (본인 또는 관리자)"""
-    comment = db.query(models.ThreadComment).filter(models.ThreadComment.id == comment_id).first()
+    comment = await db.scalar(select(models.ThreadComment).where(models.ThreadComment.id == comment_id))
     if not comment:
         raise HTTPException(status_code=404, detail="댓글을 찾을 수 없습니다")
     
@@ -1382,8 +1638,9 @@ async def delete_thread_comment(
     if comment.user_id != current_user.id and current_user.role not in ["admin", "staff"]:
         raise HTTPException(status_code=403, detail="삭제 권한이 없습니다")
     
-    db.delete(comment)
-    db.commit()
+    await db.delete(comment)
+    await db.commit()
+    await thread_list_cache.clear()
     
     return {"message": "댓글이 삭제되었습니다"}
 
@@ -1407,7 +1664,7 @@ class SignalData(BaseModel):
 async def receive_signal(
     request: Request,
     signal: SignalData, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     api_key: Optional[str] = Query(None, description="API Key")
 ):
     """MT4 EA로부터 시그널 수신"""
@@ -1428,7 +1685,7 @@ async def receive_signal(
 async def receive_signal_v2(
     request: Request,
     signal: SignalData, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     api_key: Optional[str] = Query(None, description="API Key")
 ):
     """MT4 EA로부터 시그널 수신 (대체 경로)"""
@@ -1446,7 +1703,7 @@ async def test_signal():
     """시그널 API 테스트"""
     return {"status": "ok", "expected_key": MT4_API_KEY[:4] + "****"}
 
-async def _receive_signal_internal(signal: SignalData, db: Session, api_key: str = None):
+async def _receive_signal_internal(signal: SignalData, db: AsyncSession, api_key: str = None):
     """시그널 처리 내부 함수"""
     # API Key 검증
     if api_key != MT4_API_KEY:
@@ -1508,32 +1765,32 @@ async def _receive_signal_internal(signal: SignalData, db: Session, api_key: str
     message_content = "\n".join(message_lines)
     
     # 해외선물 리딩방 찾기
-    room = db.query(models.Room).filter(models.Room.room_type == "해외선물").first()
-    if not room:
-        room = db.query(models.Room).filter(models.Room.room_type == "futures").first()
-    if not room:
+    room = (
+        registry.find_room_by_type("해외선물")
+        or registry.find_room_by_type("futures")
         # 방 이름으로 찾기
-        room = db.query(models.Room).filter(models.Room.name.contains("해외선물")).first()
-    if not room:
-        room = db.query(models.Room).filter(models.Room.name.contains("VVIP")).first()
+        or registry.find_room_by_name("해외선물")
+        or registry.find_room_by_name("VVIP")
+    )
     if not room:
         raise HTTPException(status_code=404, detail="해외선물 리딩방을 찾을 수 없습니다")
     
     # 관리자 찾기
-    admin = db.query(models.User).filter(models.User.role == "admin").first()
+    admin = await db.scalar(select(models.User).where(models.User.role == "admin"))
     if not admin:
         raise HTTPException(status_code=500, detail="관리자 계정을 찾을 수 없습니다")
     
     # 메시지 저장
-    new_message = models.Message(
+    new_message = await message_writer.save(
+        db,
         room_id=room.id,
         user_id=admin.id,
         content=message_content,
         message_type="signal"
     )
-    db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
+    await message_cache.add(room.id, serialize_message(new_message, admin))
+    await unread_counter.add(room.id, new_message.id)
+    await notify_unread(room, new_message.id, new_message.user_id)
     
     # WebSocket으로 브로드캐스트
     broadcast_data = {
@@ -1570,67 +1827,76 @@ async def test_signal_endpoint():
 # ==================== 설정 API ====================
 
 @app.get("/api/settings/{key}")
-async def get_setting(key: str, db: Session = Depends(get_db)):
+async def get_setting(key: str, request: Request):
     """설정 값 조회"""
-    setting = db.query(models.Settings).filter(models.Settings.key == key).first()
-    if not setting:
-        return {"key": key, "value": None}
-    return {"key": setting.key, "value": setting.value}
+    cached = setting_cache.get(key)
+    if cached is None:
+        body = dumps({"key": key, "value": registry.get_setting(key)})
+        cached = (body, make_etag(body))
+        setting_cache.put(key, cached)
+    body, etag = cached
+    return cached_json_response(request, body, etag)
 
 @app.put("/api/admin/settings/{key}")
 async def update_setting(
     key: str,
     value: str,
-    admin: models.User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin: UserPrincipal = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """설정 값 변경 (관리자 전용)"""
-    setting = db.query(models.Settings).filter(models.Settings.key == key).first()
+    setting = await db.scalar(select(models.Settings).where(models.Settings.key == key))
     if setting:
         setting.value = value
     else:
         setting = models.Settings(key=key, value=value)
         db.add(setting)
     
-    db.commit()
+    await db.commit()
+    await registry.set_setting(key, value)
+    await setting_cache.clear()
     return {"key": key, "value": value}
 
 @app.get("/api/admin/settings")
-async def get_all_settings(admin: models.User = Depends(get_admin_user), db: Session = Depends(get_db)):
+async def get_all_settings(admin: UserPrincipal = Depends(get_admin_user)):
     """모든 설정 조회 (관리자 전용)"""
-    settings = db.query(models.Settings).all()
-    return {s.key: s.value for s in settings}
+    return dict(registry.settings)
 
 # ==================== 서버 시작 ====================
 
 @app.on_event("startup")
 async def startup_event():
-    # 테이블 자동 생성 (새 테이블 추가 시 자동 반영)
-    from database import engine, Base
-    Base.metadata.create_all(bind=engine)
+    # 워커 간 중계 시작
+    await backplane.start()
+    
+    # 중단된 업로드의 임시 파일 정리
+    await asyncio.to_thread(clean_temp_files)
+    
+    # 테이블 생성 + 스키마 마이그레이션 (migrations.py)
+    await run_migrations(write_engine, models.Base.metadata)
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         # 관리자 계정 생성/업데이트
-        admin = db.query(models.User).filter(models.User.phone == "010-6512-6542").first()
+        admin = await db.scalar(select(models.User).where(models.User.phone == "010-6512-6542"))
         if not admin:
             admin = models.User(
                 phone="010-6512-6542",
-                password=get_password_hash("Rlawnsghl1!"),
+                password=await get_password_hash("Rlawnsghl1!"),
                 name="일타교장쌤",
                 role="admin",
                 is_approved=True
             )
             db.add(admin)
-            db.commit()
+            await db.commit()
         else:
             # 기존 관리자 이름 업데이트
             if admin.name != "일타교장쌤":
                 admin.name = "일타교장쌤"
-                db.commit()
+                await db.commit()
         
         # 기본 채팅방 생성
-        rooms = db.query(models.Room).all()
+        rooms = (await db.scalars(select(models.Room))).all()
         if not rooms:
             default_rooms = [
                 models.Room(name="교장쌤 소식방", room_type="notice", is_free=True, description="교장쌤만 메세지 작성"),
@@ -1639,12 +1905,33 @@ async def startup_event():
                 models.Room(name="코인선물 리딩방", room_type="crypto", is_free=False, description="코인선물 매매 시그널"),
             ]
             db.add_all(default_rooms)
-            db.commit()
+            await db.commit()
+        
+        # 방/설정 레지스트리 로드 (이후 쓰기 API에서 직접 갱신)
+        await registry.load(db)
+        
+        await message_writer.start()
+        await unread_counter.start()
+        await view_counter.start()
+        await upload_store.start()
         
         print("✅ 서버 시작 완료!")
         print("📌 관리자: 010-6512-6542 / Rlawnsghl1!")
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 저장 대기 중인 메시지를 모두 commit한 뒤 종료
+    await message_writer.stop()
+    await unread_counter.stop()
+    await view_counter.stop()
+    await upload_store.stop()
+    await reaction_broadcaster.stop()
+    await backplane.close()
+    await close_engines()
+    password_hasher.close()
+    image_processor.close()
 
 if __name__ == "__main__":
     import uvicorn
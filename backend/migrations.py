@@ -0,0 +1,161 @@
+"""스키마 마이그레이션 (SQLite / PostgreSQL 공통)
+
+시작 시 run_migrations가
+1. create_all로 없는 테이블 생성 (새 모델 추가 시)
+2. schema_migrations 테이블에 기록되지 않은 마이그레이션을 버전 순서대로 하나씩 적용
+3. 모델에 선언된 인덱스 중 DB에 없는 것을 출력
+create_all은 이미 있는 테이블에 컬럼/인덱스를 추가하지 않으므로, 기존 테이블 변경은 여기에 마이그레이션으로 추가한다.
+
+새 마이그레이션: 함수 작성 후 MIGRATIONS 끝에 (다음 버전, 설명, 함수) 추가. 이미 배포된 항목은 수정하지 않는다.
+여러 워커가 동시에 시작해도 PostgreSQL은 advisory lock으로, SQLite는 BEGIN IMMEDIATE(쓰기 잠금)로
+마이그레이션마다 한 워커만 적용하고, 나머지는 잠금을 기다렸다가 버전 기록을 보고 건너뛴다.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+MIGRATION_LOCK_KEY = 7301  # pg_advisory_xact_lock 키 (이 앱 전용)
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+# ---------- 마이그레이션 도우미 ----------
+
+def create_index(conn, name: str, table: str, columns: list, unique: bool = False):
+    """인덱스 생성 (이미 있으면 건너뜀)"""
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    """컬럼 추가 (이미 있으면 건너뜀). ddl 예: "INTEGER NOT NULL DEFAULT 0"
+
+    확인과 ALTER 사이에 다른 워커가 먼저 추가했어도 오류 없이 건너뛴다.
+    """
+    if column in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+        return
+    try:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    except OperationalError as e:
+        # SQLite는 ADD COLUMN IF NOT EXISTS가 없음
+        if "duplicate column name" not in str(e.orig).lower():
+            raise
+
+
+# ---------- 마이그레이션 ----------
+
+def m001_hot_query_indexes(conn):
+    """자주 실행되는 조회용 인덱스"""
+    create_index(conn, "ix_messages_room_id_id", "messages", ["room_id", "id"])
+    create_index(conn, "ix_thread_comments_thread_id_created_at", "thread_comments", ["thread_id", "created_at"])
+    create_index(conn, "ix_message_reactions_message_id_type", "message_reactions", ["message_id", "reaction_type"])
+    create_index(conn, "ix_user_room_reads_user_id_room_id", "user_room_reads", ["user_id", "room_id"])
+    create_index(conn, "ix_news_url", "news", ["url"])
+
+
+def m002_message_reaction_counts(conn):
+    """메시지별 리액션 수 컬럼 + 기존 리액션으로 채우기"""
+    add_column(conn, "messages", "heart_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "messages", "thumbsup_count", "INTEGER NOT NULL DEFAULT 0")
+    for reaction_type in ("heart", "thumbsup"):
+        conn.execute(text(
+            f"UPDATE messages SET {reaction_type}_count = ("
+            f"SELECT COUNT(*) FROM message_reactions r WHERE r.message_id = messages.id AND r.reaction_type = :type"
+            f") WHERE id IN (SELECT message_id FROM message_reactions WHERE reaction_type = :type)"
+        ), {"type": reaction_type})
+
+
+def m003_message_file_url_index(conn):
+    """업로드 GC가 파일을 참조하는 메시지를 찾을 때 사용"""
+    create_index(conn, "ix_messages_file_url", "messages", ["file_url"])
+
+
+MIGRATIONS = [
+    (1, "hot query indexes", m001_hot_query_indexes),
+    (2, "message reaction counts", m002_message_reaction_counts),
+    (3, "message file_url index", m003_message_file_url_index),
+]
+
+
+# ---------- 실행 ----------
+
+def _applied_versions(conn) -> set:
+    return set(conn.execute(select(schema_migrations.c.version)).scalars().all())
+
+
+def _lock(conn):
+    """트랜잭션이 끝날 때까지 다른 워커의 스키마 변경을 막음 (다른 워커가 적용 중이면 끝날 때까지 대기)"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    elif conn.dialect.name == "sqlite":
+        # pysqlite는 DDL 앞에 BEGIN을 넣지 않으므로 직접 쓰기 잠금을 잡음 (다른 워커는 busy_timeout 동안 대기)
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _create_tables(conn, metadata) -> set:
+    _lock(conn)
+    metadata.create_all(conn)
+    migration_metadata.create_all(conn)
+    return _applied_versions(conn)
+
+
+def _apply(conn, version: int, description: str, migrate) -> bool:
+    _lock(conn)
+    if version in _applied_versions(conn):
+        return False
+    migrate(conn)
+    conn.execute(schema_migrations.insert().values(
+        version=version, description=description, applied_at=datetime.utcnow()
+    ))
+    return True
+
+
+def find_missing_indexes(conn, metadata) -> list:
+    """모델에 선언된 인덱스 중 DB에 없는 것 ["table.index", ...]"""
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                missing.append(f"{table.name}.{index.name}")
+    return missing
+
+
+async def run_migrations(engine, metadata) -> list:
+    """테이블 생성 + 대기 중인 마이그레이션 적용. 적용한 버전 목록 반환"""
+    async with engine.begin() as conn:
+        applied = await conn.run_sync(_create_tables, metadata)
+
+    newly_applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            async with engine.begin() as conn:
+                if await conn.run_sync(_apply, version, description, migrate):
+                    newly_applied.append(version)
+                    print(f"[DB] 마이그레이션 {version:03d} 적용: {description}")
+        except IntegrityError:
+            # 다른 워커가 먼저 적용하고 기록함
+            pass
+
+    async with engine.connect() as conn:
+        missing = await conn.run_sync(find_missing_indexes, metadata)
+    for name in missing:
+        print(f"[DB] ⚠️ 인덱스 없음: {name}")
+    return newly_applied
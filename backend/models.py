@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -58,12 +58,17 @@ class Message(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
     message_type = Column(String(20), default="text")  # text, signal, image, file, emoji
-    file_url = Column(String(500), nullable=True)  # 파일/이미지 URL
+    file_url = Column(String(500), nullable=True, index=True)  # 파일/이미지 URL (업로드 GC 시 참조 확인)
     file_name = Column(String(255), nullable=True)  # 원본 파일명
+    heart_count = Column(Integer, nullable=False, default=0, server_default="0")     # 리액션 수 (message_reactions와 같은 트랜잭션에서 갱신)
+    thumbsup_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=datetime.utcnow)
     
     room = relationship("Room", back_populates="messages")
     user = relationship("User", back_populates="messages")
+    
+    # 방별 커서 페이지네이션 (WHERE room_id = ? AND id < ? ORDER BY id DESC LIMIT ?)
+    __table_args__ = (Index("ix_messages_room_id_id", "room_id", "id"),)
 
 class News(Base):
     __tablename__ = "news"
@@ -71,7 +76,7 @@ class News(Base):
     id = Column(Integer, primary_key=True, index=True)
     category = Column(String(20), nullable=False)  # stock, futures, crypto
     title = Column(String(255), nullable=False)
-    url = Column(String(500), nullable=False)
+    url = Column(String(500), nullable=False, index=True)
     source = Column(String(100), nullable=True)
     published_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -115,6 +120,8 @@ class ThreadComment(Base):
     
     thread = relationship("Thread", back_populates="comments")
     user = relationship("User")
+    
+    __table_args__ = (Index("ix_thread_comments_thread_id_created_at", "thread_id", "created_at"),)
 
 class Settings(Base):
     """시스템 설정"""
@@ -125,6 +132,18 @@ class Settings(Base):
     value = Column(String(500), nullable=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class UploadBlob(Base):
+    """업로드 파일 (내용 해시로 저장 - 같은 내용은 파일 하나를 같이 씀)"""
+    __tablename__ = "upload_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String(100), unique=True, index=True, nullable=False)  # sha256 + 확장자
+    sha256 = Column(String(64), nullable=False)
+    size = Column(Integer, nullable=False)
+    upload_count = Column(Integer, default=1)  # 업로드된 횟수 (중복 포함)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_uploaded_at = Column(DateTime, default=datetime.utcnow)  # GC 유예 기간 기준
+
 class UserRoomRead(Base):
     """사용자별 방 마지막 읽은 메시지 추적"""
     __tablename__ = "user_room_reads"
@@ -137,3 +156,5 @@ class UserRoomRead(Base):
     
     user = relationship("User")
     room = relationship("Room")
+    
+    __table_args__ = (Index("ix_user_room_reads_user_id_room_id", "user_id", "room_id"),)
@@ -133,11 +133,13 @@ async def save_news_to_db(news_list: List[Dict], db):
     """크롤링한 뉴스를 DB에 저장"""
     from models import News
     
+    from sqlalchemy import select
+    
     for news_data in news_list:
         # 중복 확인
-        existing = db.query(News).filter(News.url == news_data['url']).first()
+        existing = await db.scalar(select(News).where(News.url == news_data['url']))
         if not existing:
             news = News(**news_data)
             db.add(news)
     
-    db.commit()
+    await db.commit()
@@ -0,0 +1,104 @@
+"""비밀번호 해시/검증 (이벤트 루프 밖에서 실행)
+
+bcrypt는 호출당 100~300ms 걸리는 CPU 작업이라 async 핸들러에서 바로 호출하면
+그동안 WebSocket 전송까지 모두 멈춘다. 전용 스레드 풀에서 실행하고
+(bcrypt는 해시 중 GIL을 놓으므로 스레드로 충분) 동시에 도는 개수를 제한한다.
+
+BCRYPT_ROUNDS를 바꾸면 기존 해시는 다음 로그인 때 새 work factor로 다시 저장된다.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # bcrypt 형식이 아닌 해시
+        return False
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = PASSWORD_HASH_WORKERS):
+        self.rounds = rounds
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.semaphore = None  # 이벤트 루프 안에서 생성
+        self.waiting = 0
+        self.running = 0
+        self.stats = {"hashes": 0, "verifies": 0, "rehashes": 0, "max_waiting": 0,
+                      "wait_ms_total": 0.0, "run_ms_total": 0.0, "max_wait_ms": 0.0}
+
+    async def hash(self, password: str) -> str:
+        self.stats["hashes"] += 1
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        self.stats["verifies"] += 1
+        return await self._run(_verify, password, hashed)
+
+    async def rehash(self, password: str) -> str:
+        """로그인 성공 시 현재 work factor로 다시 해시"""
+        self.stats["rehashes"] += 1
+        return await self._run(_hash, password, self.rounds)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """저장된 해시의 work factor가 현재 설정과 다른지 ($2b$12$... 형식)"""
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    async def _run(self, func, *args):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.workers)
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.stats["max_waiting"] = max(self.stats["max_waiting"], self.waiting)
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            started = time.perf_counter()
+            wait_ms = (started - queued_at) * 1000
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+            self.running += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            finally:
+                self.running -= 1
+                self.stats["run_ms_total"] += (time.perf_counter() - started) * 1000
+        finally:
+            self.semaphore.release()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self):
+        calls = self.stats["hashes"] + self.stats["verifies"]
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "waiting": self.waiting,
+            "running": self.running,
+            "hashes": self.stats["hashes"],
+            "verifies": self.stats["verifies"],
+            "rehashes": self.stats["rehashes"],
+            "max_waiting": self.stats["max_waiting"],
+            "avg_wait_ms": round(self.stats["wait_ms_total"] / calls, 2) if calls else 0.0,
+            "max_wait_ms": round(self.stats["max_wait_ms"], 2),
+            "avg_run_ms": round(self.stats["run_ms_total"] / calls, 2) if calls else 0.0,
+        }
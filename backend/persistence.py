@@ -0,0 +1,211 @@
+"""채팅/시그널 메시지 저장 파이프라인
+
+MESSAGE_PERSIST_MODE 환경변수로 선택
+- sync (기본): 메시지마다 바로 commit (기존 방식)
+- group: id와 시간을 먼저 정해서 바로 브로드캐스트하고,
+         INSERT는 모아서 짧은 주기로 한 트랜잭션에 commit (group commit)
+         종료 시 남은 메시지는 모두 저장한 뒤 종료
+         일괄 INSERT가 실패하면 한 개씩 다시 넣고, 그래도 제약 조건에 걸리는 행은 빼고 기록만 남긴다
+         (잘못된 행 하나 때문에 뒤의 메시지가 모두 막히지 않도록)
+         SQLite는 id를 프로세스 메모리에서 정하므로 여러 워커로 실행하면 sync 모드로 동작한다
+         PostgreSQL은 여러 워커로 실행하면 id 순서가 시간 순서와 같도록 메시지마다 nextval을 한 번씩 호출한다
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import DataError, IntegrityError
+
+import models
+
+MESSAGE_PERSIST_MODE = os.getenv("MESSAGE_PERSIST_MODE", "sync")
+MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "50"))  # 최대 대기 시간
+MESSAGE_FLUSH_BATCH = int(os.getenv("MESSAGE_FLUSH_BATCH", "200"))            # 한 번에 commit할 최대 개수
+ID_BLOCK_SIZE = 100      # PostgreSQL 시퀀스에서 한 번에 받아오는 id 개수 (워커 하나일 때)
+RETRY_DELAY = 1.0
+SHUTDOWN_RETRIES = 5
+
+MESSAGE_COLUMNS = ("id", "room_id", "user_id", "content", "message_type", "file_url", "file_name", "created_at")
+REQUIRED_COLUMNS = ("room_id", "user_id", "content")  # NOT NULL - 없으면 저장 전에 거부
+
+
+class MessageWriter:
+    def __init__(self, session_factory, mode: str = MESSAGE_PERSIST_MODE,
+                 flush_interval_ms: int = MESSAGE_FLUSH_INTERVAL_MS, batch_size: int = MESSAGE_FLUSH_BATCH,
+                 multi_worker: bool = False):
+        self.session_factory = session_factory
+        self.mode = mode
+        self.multi_worker = multi_worker  # 여러 워커가 같은 DB에 저장 (백플레인 사용)
+        # 워커마다 id 블록을 따로 받으면 나중 메시지가 더 작은 id를 받을 수 있음 (id 순서 = 시간 순서가 깨짐)
+        self.id_block_size = 1 if multi_worker else ID_BLOCK_SIZE
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.pending: list = []   # 아직 commit 안 된 INSERT (dict)
+        self.ids: list = []       # 미리 받아둔 id
+        self.next_id = None       # SQLite: 메모리 카운터
+        self.use_sequence = False
+        self.wakeup = asyncio.Event()      # 대기 중인 메시지 있음
+        self.batch_full = asyncio.Event()  # batch_size만큼 모임 - 바로 flush
+        self.flush_lock = asyncio.Lock()
+        self.task = None
+        self.rejected = deque(maxlen=100)  # 제약 조건 위반으로 저장하지 못한 행 (최근 것만)
+        self.stats = {"saved": 0, "flushes": 0, "flushed_rows": 0, "max_batch": 0,
+                      "last_flush_ms": 0.0, "failures": 0, "rejected": 0}
+
+    @property
+    def group_commit(self) -> bool:
+        return self.mode == "group"
+
+    async def start(self):
+        if not self.group_commit:
+            return
+        await self._init_ids()
+        if not self.use_sequence and self.multi_worker:
+            # 워커마다 같은 max(id)+1부터 나눠 주게 되므로 group commit을 쓰지 않음
+            self.mode = "sync"
+            print("[DB] SQLite에서 여러 워커로 실행 중 - 메시지 group commit 대신 sync 모드 사용")
+            return
+        self.task = asyncio.create_task(self._flush_loop())
+        print(f"[DB] 메시지 group commit 사용 (최대 {self.flush_interval * 1000:.0f}ms, {self.batch_size}개)")
+
+    async def stop(self):
+        """남은 메시지를 모두 저장하고 종료"""
+        if self.task:
+            # INSERT 도중에 취소되면 배치를 잃으므로 진행 중인 flush가 끝난 뒤 취소
+            async with self.flush_lock:
+                self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for _ in range(SHUTDOWN_RETRIES):
+            if await self.flush():
+                return
+            await asyncio.sleep(RETRY_DELAY)
+        if self.pending:
+            print(f"[DB] 종료 시 메시지 {len(self.pending)}개 저장 실패")
+
+    async def save(self, db, **fields) -> models.Message:
+        """메시지 저장. group 모드에서는 id/created_at만 정하고 바로 반환
+
+        필수 값(REQUIRED_COLUMNS)이 없으면 ValueError (id를 받거나 브로드캐스트하기 전에 거부)
+        """
+        missing = [column for column in REQUIRED_COLUMNS if fields.get(column) is None]
+        if missing:
+            raise ValueError(f"메시지 필수 값 없음: {', '.join(missing)}")
+        self.stats["saved"] += 1
+        if not self.group_commit:
+            message = models.Message(**fields)
+            db.add(message)
+            await db.commit()
+            await db.refresh(message)
+            return message
+
+        fields.setdefault("created_at", datetime.utcnow())
+        fields.setdefault("message_type", "text")
+        fields["id"] = await self._allocate_id()
+        row = {column: fields.get(column) for column in MESSAGE_COLUMNS}
+        self.pending.append(row)
+        self.wakeup.set()
+        if len(self.pending) >= self.batch_size:
+            self.batch_full.set()
+        return models.Message(**row)
+
+    async def flush(self) -> bool:
+        """대기 중인 INSERT를 한 트랜잭션으로 commit
+
+        일괄 INSERT가 실패하면 한 개씩 다시 넣는다. 제약 조건 위반 행은 빼고(rejected),
+        DB 연결 문제처럼 행과 상관없는 실패면 남은 행을 다시 대기열에 두고 False
+        """
+        async with self.flush_lock:
+            while self.pending:
+                batch = self.pending[:self.batch_size]
+                del self.pending[:len(batch)]
+                started = time.perf_counter()
+                try:
+                    await self._insert(batch)
+                except Exception as e:
+                    self.stats["failures"] += 1
+                    print(f"[DB] 메시지 {len(batch)}개 일괄 저장 실패, 한 개씩 다시 저장: {getattr(e, 'orig', e)}")
+                    remaining = await self._insert_each(batch)
+                    if remaining:
+                        self.pending[:0] = remaining
+                        print(f"[DB] 메시지 {len(remaining)}개 저장 실패 (재시도 예정)")
+                        return False
+                    continue
+                self.stats["flushes"] += 1
+                self.stats["flushed_rows"] += len(batch)
+                self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+                self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return True
+
+    async def _flush_loop(self):
+        while True:
+            await self.wakeup.wait()
+            # 배치가 찰 때까지 또는 flush_interval까지 모으기
+            if len(self.pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self.batch_full.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            self.batch_full.clear()
+            if not await self.flush():
+                await asyncio.sleep(RETRY_DELAY)
+                self.wakeup.set()
+
+    async def _insert(self, rows: list):
+        async with self.session_factory() as db:
+            try:
+                await db.execute(insert(models.Message), rows)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+    async def _insert_each(self, rows: list) -> list:
+        """한 행씩 INSERT. 제약 조건 위반 행은 제외하고, 다른 오류가 나면 그 행부터 반환"""
+        for index, row in enumerate(rows):
+            try:
+                await self._insert([row])
+            except (IntegrityError, DataError) as e:
+                self.rejected.append(row)
+                self.stats["rejected"] += 1
+                print(f"[DB] 메시지 저장 제외 (id={row['id']}, room={row['room_id']}, user={row['user_id']}): {e.orig}")
+                continue
+            except Exception:
+                return rows[index:]
+            self.stats["flushed_rows"] += 1
+        return []
+
+    async def _init_ids(self):
+        async with self.session_factory() as db:
+            self.use_sequence = db.get_bind().dialect.name == "postgresql"
+            if not self.use_sequence:
+                # SQLite는 단일 프로세스 배포 기준 - 메모리 카운터
+                self.next_id = (await db.scalar(select(func.max(models.Message.id))) or 0) + 1
+
+    async def _allocate_id(self) -> int:
+        if not self.use_sequence:
+            message_id = self.next_id
+            self.next_id += 1
+            return message_id
+        while not self.ids:
+            self.ids.extend(await self._reserve_ids())
+        return self.ids.pop(0)
+
+    async def _reserve_ids(self) -> list:
+        """PostgreSQL 시퀀스에서 id를 id_block_size개씩 예약 (여러 워커에서도 겹치지 않음)"""
+        async with self.session_factory() as db:
+            rows = (await db.execute(text(
+                "SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, :n)"
+            ), {"n": self.id_block_size})).scalars().all()
+            await db.commit()
+            return list(rows)
+
+    def get_stats(self):
+        return {**self.stats, "mode": self.mode, "pending": len(self.pending), "id_block_size": self.id_block_size}
@@ -0,0 +1,409 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+from fastapi import WebSocket
+
+from backplane import Backplane, LocalBackplane
+
+try:
+    import orjson  # 있으면 빠른 인코더 사용
+except ImportError:
+    orjson = None
+
+# 연결별 송신 큐 설정
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))          # 연결당 대기 가능한 메시지 수
+WS_MAX_LAG_SECONDS = float(os.getenv("WS_MAX_LAG_SECONDS", "10"))        # 이 시간 이상 밀리면 느린 클라이언트로 판단
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect")  # disconnect: 연결 종료, drop: 메시지 버림
+WS_CLOSE_TIMEOUT = 5.0
+WS_REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "500"))  # 방별로 보관하는 최근 이벤트 수
+REACTION_BROADCAST_WINDOW_MS = float(os.getenv("REACTION_BROADCAST_WINDOW_MS", "250"))  # 0이면 모으지 않고 바로 전송
+
+# 1013 = Try Again Later (클라이언트는 재연결)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def encode_frame(message: dict) -> str:
+    """브로드캐스트 메시지를 텍스트 프레임으로 한 번만 인코딩"""
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    # Starlette send_json과 같은 형식
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def with_seq(frame: str, seq: int) -> str:
+    """인코딩된 JSON 객체 프레임 앞에 seq 필드 삽입 (다시 인코딩하지 않음)"""
+    if frame == "{}":
+        return '{"seq":%d}' % seq
+    return '{"seq":%d,' % seq + frame[1:]
+
+
+class ReplayBuffer:
+    """방별 최근 브로드캐스트 이벤트 링 버퍼 (재연결 시 놓친 이벤트 재전송)"""
+
+    __slots__ = ("seq", "frames")
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.frames = deque(maxlen=size)  # (seq, frame)
+
+    def append(self, frame: str) -> str:
+        self.seq += 1
+        frame = with_seq(frame, self.seq)
+        self.frames.append((self.seq, frame))
+        return frame
+
+    def since(self, last_seq: int):
+        """last_seq 이후 이벤트 목록. 버퍼 범위를 벗어나면 None (DB에서 다시 로드해야 함)"""
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.frames or self.frames[0][0] > last_seq + 1:
+            return None
+        return [frame for seq, frame in self.frames if seq > last_seq]
+
+
+class ClientConnection:
+    """WebSocket 하나에 대한 연결 레코드 (송신 큐 + writer 태스크)"""
+
+    __slots__ = (
+        "manager", "conn_id", "websocket", "room_id", "user_id", "user_name", "user_role",
+        "connected_at", "queue", "writer", "closer", "closed", "sending", "head_enqueued_at",
+    )
+
+    def __init__(self, manager: "ConnectionManager", conn_id: int, websocket: WebSocket, room_id: str,
+                 user_id: int, user_name: str = "", user_role: str = ""):
+        self.manager = manager
+        self.conn_id = conn_id
+        self.websocket = websocket
+        self.room_id = room_id
+        self.user_id = user_id
+        self.user_name = user_name
+        self.user_role = user_role
+        self.connected_at = datetime.utcnow().isoformat()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=manager.queue_size)
+        self.writer: asyncio.Task = None
+        self.closer: asyncio.Task = None  # 느린 클라이언트 종료 태스크 (GC되지 않게 참조 보관)
+        self.closed = False
+        self.sending = False
+        self.head_enqueued_at = 0.0  # 현재 전송 중인 메시지가 큐에 들어간 시각
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def lag(self, now: float = None) -> float:
+        """가장 오래 기다리고 있는 메시지의 대기 시간(초)"""
+        if not self.sending and self.queue.empty():
+            return 0.0
+        return (now or time.monotonic()) - self.head_enqueued_at
+
+    def send_json(self, message: dict) -> bool:
+        """이 연결에만 전송"""
+        return self.enqueue(encode_frame(message))
+
+    def enqueue(self, frame: str) -> bool:
+        """인코딩된 프레임을 블로킹 없이 큐에 넣기. 느린 클라이언트면 정책에 따라 처리"""
+        if self.closed:
+            return False
+
+        now = time.monotonic()
+        if self.lag(now) > self.manager.max_lag:
+            return self._on_slow_consumer()
+        if not self.sending and self.queue.empty():
+            self.head_enqueued_at = now
+        try:
+            self.queue.put_nowait((now, frame))
+        except asyncio.QueueFull:
+            return self._on_slow_consumer()
+        return True
+
+    def _on_slow_consumer(self) -> bool:
+        if self.manager.slow_consumer_policy == "drop":
+            self.manager.stats["dropped"] += 1
+            return False
+        if self.closer is None:
+            self.manager.stats["slow_disconnects"] += 1
+            print(f"[WS] 느린 클라이언트 연결 종료: room={self.room_id}, user={self.user_id}, lag={self.lag():.1f}s")
+            self.closer = asyncio.create_task(self.close(SLOW_CONSUMER_CLOSE_CODE))
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                enqueued_at, frame = await self.queue.get()
+                self.head_enqueued_at = enqueued_at
+                self.sending = True
+                await self.websocket.send_text(frame)
+                self.sending = False
+                self.manager.stats["delivered"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 전송 실패 = 끊어진 소켓. 정리는 수신 루프의 disconnect에서 처리
+            print(f"[WS] 전송 실패: room={self.room_id}, user={self.user_id}: {e}")
+            self.closed = True
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer:
+            self.writer.cancel()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), timeout=WS_CLOSE_TIMEOUT)
+        except Exception:
+            pass
+
+    def stop(self):
+        """소켓이 이미 끊어진 뒤 writer 정리"""
+        self.closed = True
+        if self.writer:
+            self.writer.cancel()
+
+
+# WebSocket 연결 관리자
+class ConnectionManager:
+    def __init__(self, backplane: Backplane = None, queue_size: int = WS_SEND_QUEUE_SIZE,
+                 max_lag: float = WS_MAX_LAG_SECONDS, slow_consumer_policy: str = WS_SLOW_CONSUMER_POLICY,
+                 replay_size: int = WS_REPLAY_BUFFER_SIZE):
+        # 다른 워커에서 온 방 이벤트도 이 워커의 소켓으로 전달
+        self.backplane = backplane or LocalBackplane()
+        self.backplane.subscribe("room", self._on_remote_room_event)
+        self.backplane.subscribe("user", self._on_remote_user_event)
+        self.backplane.subscribe("all", self._on_remote_all_event)
+        self.backplane.subscribe("drop_room", self._on_remote_drop_room)
+        self.queue_size = queue_size
+        self.max_lag = max_lag
+        self.slow_consumer_policy = slow_consumer_policy
+        # 연결 레지스트리 - 모두 conn_id를 키로 하는 dict (순서 있는 집합)
+        self.connections: dict = {}  # conn_id: ClientConnection
+        self.rooms: dict = {}        # room_id: {conn_id: ClientConnection}
+        self.users: dict = {}        # user_id: {conn_id: ClientConnection} (여러 탭 지원)
+        self._ids = itertools.count(1)
+        # 재연결 복구용 방별 링 버퍼. seq는 워커마다 따로 매기므로 epoch(워커 식별자)와 함께 사용
+        self.replay_size = replay_size
+        self.replay: dict = {}       # room_id: ReplayBuffer
+        self.epoch = self.backplane.origin
+        self.stats = {"broadcasts": 0, "delivered": 0, "dropped": 0, "slow_disconnects": 0,
+                      "replayed": 0, "resyncs": 0}
+
+    async def connect(self, websocket: WebSocket, room_id: str, user_id: int, user_name: str = "", user_role: str = "",
+                      last_seq: int = None, epoch: str = None) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(self, next(self._ids), websocket, room_id, user_id, user_name, user_role)
+        connection.start()
+
+        self.connections[connection.conn_id] = connection
+        self.rooms.setdefault(room_id, {})[connection.conn_id] = connection
+        self.users.setdefault(user_id, {})[connection.conn_id] = connection
+        # 등록과 같은 틱에서 재전송까지 끝내야 새 이벤트와 순서가 섞이지 않음
+        self._resume(connection, last_seq, epoch)
+        return connection
+
+    def _resume(self, connection: ClientConnection, last_seq: int = None, epoch: str = None):
+        """현재 seq 알려주고, 재연결이면 놓친 이벤트 재전송 (범위 밖이면 resync 요청)"""
+        buffer = self._replay_buffer(connection.room_id)
+        connection.send_json({"type": "hello", "epoch": self.epoch, "seq": buffer.seq})
+        if last_seq is None:
+            return
+        missed = buffer.since(last_seq) if epoch == self.epoch else None
+        if missed is None:
+            self.stats["resyncs"] += 1
+            connection.send_json({"type": "resync", "seq": buffer.seq})
+            return
+        for frame in missed:
+            connection.enqueue(frame)
+        self.stats["replayed"] += len(missed)
+
+    def _replay_buffer(self, room_id: str) -> ReplayBuffer:
+        buffer = self.replay.get(room_id)
+        if buffer is None:
+            buffer = self.replay[room_id] = ReplayBuffer(self.replay_size)
+        return buffer
+
+    def disconnect(self, connection: ClientConnection):
+        connection.stop()
+        if self.connections.pop(connection.conn_id, None) is None:
+            return
+        for index, key in ((self.rooms, connection.room_id), (self.users, connection.user_id)):
+            members = index.get(key)
+            if members is not None:
+                members.pop(connection.conn_id, None)
+                if not members:
+                    del index[key]
+
+    async def drop_room(self, room_id: str):
+        """삭제된 방의 재전송 버퍼 제거 (모든 워커)"""
+        self.replay.pop(room_id, None)
+        await self.backplane.publish("drop_room", {"room_id": room_id})
+
+    def _on_remote_drop_room(self, payload: dict):
+        self.replay.pop(payload["room_id"], None)
+
+    def get_room_connections(self, room_id: str):
+        return self.rooms.get(room_id, {}).values()
+
+    def get_user_connections(self, user_id: int):
+        return self.users.get(user_id, {}).values()
+
+    async def send_message(self, message: dict, room_id: str):
+        """방 전체에 전송 - 한 번만 인코딩해서 각 연결의 큐에 넣고 기다리지 않음"""
+        frame = encode_frame(message)
+        self._deliver_room(room_id, frame)
+        await self.backplane.publish("room", {"room_id": room_id, "frame": frame})
+
+    def _on_remote_room_event(self, payload: dict):
+        self._deliver_room(payload["room_id"], payload["frame"])
+
+    def _deliver_room(self, room_id: str, frame: str):
+        frame = self._replay_buffer(room_id).append(frame)
+        connections = self.rooms.get(room_id)
+        if connections:
+            self.broadcast_frame(frame, connections.values())
+
+    async def send_to_user(self, user_id: int, message: dict, exclude: "ClientConnection" = None):
+        """한 사용자의 모든 연결(여러 탭/기기)에 전송 - 재전송 버퍼에는 넣지 않음
+
+        exclude: 보내지 않을 이 워커의 연결 (요청을 보낸 연결)
+        """
+        frame = encode_frame(message)
+        self._deliver_user(user_id, frame, exclude)
+        await self.backplane.publish("user", {"user_id": user_id, "frame": frame})
+
+    async def send_to_all(self, message: dict, exclude_room: str = None, exclude_user: int = None):
+        """접속 중인 모든 연결에 전송 (exclude_room 방에 있는 연결, exclude_user 사용자는 제외)"""
+        frame = encode_frame(message)
+        self._deliver_all(frame, exclude_room, exclude_user)
+        await self.backplane.publish("all", {"frame": frame, "exclude_room": exclude_room, "exclude_user": exclude_user})
+
+    def _on_remote_user_event(self, payload: dict):
+        self._deliver_user(payload["user_id"], payload["frame"])
+
+    def _on_remote_all_event(self, payload: dict):
+        self._deliver_all(payload["frame"], payload.get("exclude_room"), payload.get("exclude_user"))
+
+    def _deliver_user(self, user_id: int, frame: str, exclude: "ClientConnection" = None):
+        connections = self.users.get(user_id)
+        if connections:
+            self.broadcast_frame(frame, (
+                connection for connection in connections.values() if connection is not exclude
+            ))
+
+    def _deliver_all(self, frame: str, exclude_room: str = None, exclude_user: int = None):
+        self.broadcast_frame(frame, (
+            connection for connection in self.connections.values()
+            if connection.room_id != exclude_room and connection.user_id != exclude_user
+        ))
+
+    def broadcast_frame(self, frame: str, connections):
+        self.stats["broadcasts"] += 1
+        for connection in connections:
+            connection.enqueue(frame)
+
+    def get_online_users(self, room_id: str = None):
+        """접속자 목록 - 같은 사용자의 여러 탭은 한 명으로"""
+        if room_id:
+            return list(self._online_users(room_id).values())
+        # 전체 접속자
+        all_users = []
+        for rid in self.rooms:
+            for info in self._online_users(rid).values():
+                info["room_id"] = rid
+                all_users.append(info)
+        return all_users
+
+    def _online_users(self, room_id: str) -> dict:
+        users = {}
+        for connection in self.get_room_connections(room_id):
+            if connection.user_id not in users:
+                users[connection.user_id] = {
+                    "user_id": connection.user_id,
+                    "name": connection.user_name,
+                    "role": connection.user_role,
+                    "connected_at": connection.connected_at
+                }
+        return users
+
+    def get_stats(self):
+        connections = self.connections.values()
+        now = time.monotonic()
+        return {
+            **self.stats,
+            "connections": len(self.connections),
+            "rooms": len(self.rooms),
+            "users": len(self.users),
+            "queued": sum(c.queue.qsize() for c in connections),
+            "max_lag": round(max((c.lag(now) for c in connections), default=0.0), 3),
+            "queue_size": self.queue_size,
+            "max_lag_threshold": self.max_lag,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "replay_buffers": len(self.replay),
+            "replay_size": self.replay_size,
+            "backplane": self.backplane.get_stats(),
+        }
+
+
+class ReactionCoalescer:
+    """메시지별 리액션 이벤트를 window 동안 모아서 마지막 카운트만 방에 전송
+
+    첫 토글 후 window가 지나면 그 사이 마지막 이벤트 하나만 보낸다 (toggles: 모인 토글 수).
+    인기 시그널에 하트가 몰려도 메시지당 window마다 프레임 하나.
+    """
+
+    def __init__(self, manager: ConnectionManager, window_ms: float = REACTION_BROADCAST_WINDOW_MS):
+        self.manager = manager
+        self.window = window_ms / 1000
+        self.pending: dict = {}  # message_id: (room_id, 마지막 이벤트, 모인 토글 수)
+        self.tasks: dict = {}    # message_id: window 후 전송할 task
+        self.stats = {"toggles": 0, "frames_sent": 0}
+
+    async def publish(self, room_id: str, message: dict):
+        self.stats["toggles"] += 1
+        if self.window <= 0:
+            await self._send(room_id, message)
+            return
+        message_id = message["message_id"]
+        entry = self.pending.get(message_id)
+        self.pending[message_id] = (room_id, message, entry[2] + 1 if entry else 1)
+        if message_id not in self.tasks:
+            self.tasks[message_id] = asyncio.create_task(self._flush_later(message_id))
+
+    async def _flush_later(self, message_id: int):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self.tasks.pop(message_id, None)
+        await self._flush(message_id)
+
+    async def _flush(self, message_id: int):
+        entry = self.pending.pop(message_id, None)
+        if entry is not None:
+            room_id, message, toggles = entry
+            await self._send(room_id, {**message, "toggles": toggles})
+
+    async def _send(self, room_id: str, message: dict):
+        self.stats["frames_sent"] += 1
+        await self.manager.send_message(message, room_id)
+
+    async def stop(self):
+        """대기 중인 이벤트를 바로 전송하고 종료"""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for message_id in list(self.pending):
+            await self._flush(message_id)
+
+    def get_stats(self):
+        pending_toggles = sum(entry[2] for entry in self.pending.values())
+        return {
+            **self.stats,
+            "frames_saved": self.stats["toggles"] - self.stats["frames_sent"] - pending_toggles,
+            "pending": len(self.pending),
+            "window_ms": self.window * 1000,
+        }
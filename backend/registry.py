@@ -0,0 +1,125 @@
+"""방/설정 레지스트리 (메모리)
+
+방 정보와 설정은 거의 바뀌지 않는데 메시지 조회, WebSocket 연결, 시그널 수신마다 DB에서 읽고 있었다.
+시작 시 한 번 읽어 두고, 방 생성/수정/삭제와 설정 변경 시 바로 갱신한다 (write-through).
+여러 워커로 실행할 때는 백플레인 "registry" 채널로 변경 내용을 다른 워커에도 반영한다.
+"""
+from datetime import datetime
+
+from sqlalchemy import select
+
+import models
+from backplane import Backplane, LocalBackplane
+
+
+class RoomInfo:
+    """방 정보 (ORM 객체가 아닌 가벼운 읽기 전용 사본, schemas.RoomResponse 형식)"""
+
+    __slots__ = ("id", "name", "room_type", "is_free", "description", "created_at")
+
+    def __init__(self, id: int, name: str, room_type: str, is_free: bool, description, created_at: datetime):
+        self.id = id
+        self.name = name
+        self.room_type = room_type
+        self.is_free = is_free
+        self.description = description
+        self.created_at = created_at
+
+    @classmethod
+    def from_model(cls, room: models.Room) -> "RoomInfo":
+        return cls(room.id, room.name, room.room_type, bool(room.is_free), room.description, room.created_at)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "room_type": self.room_type,
+            "is_free": self.is_free,
+            "description": self.description,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RoomInfo":
+        created_at = datetime.fromisoformat(data["created_at"]) if data.get("created_at") else None
+        return cls(data["id"], data["name"], data["room_type"], data["is_free"], data.get("description"), created_at)
+
+
+class Registry:
+    def __init__(self, backplane: Backplane = None):
+        self.backplane = backplane or LocalBackplane()
+        self.backplane.subscribe("registry", self._on_remote_event)
+        self.rooms: dict = {}     # room_id: RoomInfo (id 순)
+        self.settings: dict = {}  # key: value
+        self.stats = {"loads": 0, "room_updates": 0, "setting_updates": 0}
+
+    async def load(self, db):
+        """DB에서 전체 방/설정 읽기 (시작 시)"""
+        rooms = (await db.scalars(select(models.Room).order_by(models.Room.id))).all()
+        settings = (await db.execute(select(models.Settings.key, models.Settings.value))).all()
+        self.rooms = {room.id: RoomInfo.from_model(room) for room in rooms}
+        self.settings = {key: value for key, value in settings}
+        self.stats["loads"] += 1
+
+    # ---------- 방 ----------
+
+    def get_room(self, room_id: int):
+        return self.rooms.get(room_id)
+
+    def list_rooms(self, is_free: bool = None) -> list:
+        return [room for room in self.rooms.values() if is_free is None or room.is_free == is_free]
+
+    def find_room_by_type(self, room_type: str):
+        return next((room for room in self.rooms.values() if room.room_type == room_type), None)
+
+    def find_room_by_name(self, text: str):
+        """이름에 text가 들어간 첫 번째 방"""
+        return next((room for room in self.rooms.values() if text in room.name), None)
+
+    async def put_room(self, room: models.Room):
+        """방 생성/수정 후 호출 (commit 이후)"""
+        info = RoomInfo.from_model(room)
+        self._put_room(info)
+        await self.backplane.publish("registry", {"op": "room", "room": info.to_dict()})
+
+    async def remove_room(self, room_id: int):
+        self._remove_room(room_id)
+        await self.backplane.publish("registry", {"op": "remove_room", "room_id": room_id})
+
+    def _put_room(self, info: RoomInfo):
+        is_new = info.id not in self.rooms
+        self.rooms[info.id] = info
+        if is_new and any(room_id > info.id for room_id in self.rooms):
+            # 늦게 도착한 방 - id 순서 유지
+            self.rooms = dict(sorted(self.rooms.items()))
+        self.stats["room_updates"] += 1
+
+    def _remove_room(self, room_id: int):
+        self.rooms.pop(room_id, None)
+        self.stats["room_updates"] += 1
+
+    # ---------- 설정 ----------
+
+    def get_setting(self, key: str, default=None):
+        return self.settings.get(key, default)
+
+    async def set_setting(self, key: str, value):
+        """설정 변경 후 호출 (commit 이후)"""
+        self._set_setting(key, value)
+        await self.backplane.publish("registry", {"op": "setting", "key": key, "value": value})
+
+    def _set_setting(self, key: str, value):
+        self.settings[key] = value
+        self.stats["setting_updates"] += 1
+
+    def _on_remote_event(self, payload: dict):
+        op = payload.get("op")
+        if op == "room":
+            self._put_room(RoomInfo.from_dict(payload["room"]))
+        elif op == "remove_room":
+            self._remove_room(payload["room_id"])
+        elif op == "setting":
+            self._set_setting(payload["key"], payload["value"])
+
+    def get_stats(self):
+        return {**self.stats, "rooms": len(self.rooms), "settings": len(self.settings)}
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, validator
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 # ==================== User Schemas ====================
 
@@ -87,6 +87,10 @@ class MessageCreate(BaseModel):
     content: str
     message_type: str = "text"
 
+class ReactionCounts(BaseModel):
+    heart: int = 0
+    thumbsup: int = 0
+
 class MessageResponse(BaseModel):
     id: int
     room_id: int
@@ -97,6 +101,9 @@ class MessageResponse(BaseModel):
     file_name: Optional[str] = None
     created_at: datetime
     user: Optional[MessageUserResponse] = None
+    reactions: ReactionCounts = ReactionCounts()
+    my_reactions: Optional[List[str]] = None  # 로그인한 경우 내가 누른 리액션
+    variants: Optional[Dict[str, str]] = None  # 이미지 파생본 URL {"thumb": ..., "preview": ...}
     
     class Config:
         from_attributes = True
@@ -187,3 +194,6 @@ class ThreadResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+class ThreadListItemResponse(ThreadResponse):
+    content: Optional[str] = None  # 목록 조회에서 summary=true면 생략
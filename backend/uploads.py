@@ -0,0 +1,495 @@
+"""업로드 파일 저장
+
+업로드 본문을 메모리에 통째로 올리지 않는다.
+- UploadLimitMiddleware: 업로드 요청 본문이 제한을 넘는 순간 413으로 중단
+  (Content-Length로 먼저 거르고, 받는 중에도 누적 크기를 확인)
+- UploadStore: multipart 파서가 임시 파일에 받아 둔 업로드를 청크 단위로 UPLOAD_DIR의 임시 파일에 복사하면서
+  sha256을 계산하고, 내용 해시 파일명으로 원자적으로 이동 (같은 내용이면 기존 파일 재사용).
+  참조가 없어진 파일은 메시지/방 삭제 후와 주기적으로 정리한다.
+  파일 I/O는 스레드에서 실행해 이벤트 루프를 막지 않는다.
+- UploadFiles: /uploads 정적 파일 서빙. 파일명이 내용(또는 uuid)으로 정해져 바뀌지 않으므로
+  immutable 캐시 + 강한 ETag를 붙이고, PDF/zip 이어받기용 Range와 미리 압축해 둔 .gz를 지원한다.
+  없는 이미지 파생본은 요청 시 생성.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import stat
+import uuid
+from datetime import datetime, timedelta
+from mimetypes import guess_type
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import exists, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+import models
+from images import IMAGE_VARIANTS, ImageProcessor, parse_variant_filename, variant_filename
+
+UPLOAD_DIR = Path("uploads")
+UPLOAD_TMP_DIR = UPLOAD_DIR / ".tmp"  # 같은 파일 시스템이어야 rename이 원자적
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # 파일 외 multipart 경계/헤더 여유분
+
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+FILE_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_TOO_LARGE = "파일 크기는 5MB 이하여야 합니다"
+FILE_TOO_LARGE = "파일 크기는 10MB 이하여야 합니다"
+
+UPLOAD_GC_GRACE_SECONDS = float(os.getenv("UPLOAD_GC_GRACE_SECONDS", "3600"))          # 업로드 후 이 시간 동안은 참조가 없어도 유지
+UPLOAD_GC_INTERVAL_SECONDS = float(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", str(6 * 3600)))  # 전체 정리 주기
+# 서버가 만든 업로드 파일명 (sha256, 예전 업로드는 uuid4 + 확장자) - 이 형식만 정리 대상
+UPLOAD_FILENAME = re.compile(
+    r"^(?:[0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.[a-z0-9]+$"
+)
+SHA256_FILENAME = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]+$")
+
+# 파일명이 바뀌지 않는 한 내용도 바뀌지 않으므로 1년 + immutable (새로고침해도 재검증 안 함)
+UPLOAD_CACHE_CONTROL = os.getenv("UPLOAD_CACHE_CONTROL", "public, max-age=31536000, immutable")
+# 업로드 시 .gz를 같이 만들어 둘 형식 (이미지/docx/xlsx/zip은 이미 압축되어 있어 제외)
+PRECOMPRESS_EXTENSIONS = {".txt", ".pdf", ".doc", ".xls"}
+PRECOMPRESS_MIN_SAVING = 0.1  # 10% 이상 줄어들 때만 .gz 유지
+
+
+class UploadLimitMiddleware:
+    """경로별 요청 본문 크기 제한 (순수 ASGI 미들웨어)"""
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits  # path: (최대 파일 크기, 오류 메시지)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.limits:
+            await self.app(scope, receive, send)
+            return
+        max_bytes, detail = self.limits[scope["path"]]
+        limit = max_bytes + MULTIPART_OVERHEAD
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            # 본문을 받기 전에 거절
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # multipart 파싱 중에 발생 -> FastAPI가 413 응답으로 변환
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _copy_to_temp(src, tmp_path: Path, max_bytes: int):
+    """src를 청크 단위로 tmp_path에 복사. (크기, sha256) 반환, max_bytes를 넘으면 None"""
+    size = 0
+    digest = hashlib.sha256()
+    with open(tmp_path, "wb") as out:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                return None
+            digest.update(chunk)
+            out.write(chunk)
+    return size, digest.hexdigest()
+
+
+def _place(tmp_path: Path, dest: Path) -> bool:
+    """임시 파일을 dest로 이동. 같은 내용의 파일이 이미 있으면 임시 파일만 지우고 False"""
+    if dest.exists():
+        _discard(tmp_path)
+        return False
+    os.replace(tmp_path, dest)
+    return True
+
+
+def _precompress(path: Path) -> bool:
+    """path.gz 생성 (충분히 줄어들 때만). 만들었으면 True"""
+    tmp_path = UPLOAD_TMP_DIR / f"{uuid.uuid4()}.part"
+    try:
+        with open(path, "rb") as src, gzip.GzipFile(tmp_path, "wb", compresslevel=9, mtime=0) as out:
+            shutil.copyfileobj(src, out, UPLOAD_CHUNK_SIZE)
+        if tmp_path.stat().st_size > path.stat().st_size * (1 - PRECOMPRESS_MIN_SAVING):
+            _discard(tmp_path)
+            return False
+        os.replace(tmp_path, f"{path}.gz")
+        return True
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+def _discard(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _remove_files(directory: Path, filenames) -> int:
+    """업로드 파일과 이미지 파생본 삭제. 삭제한 원본 수 반환"""
+    removed = 0
+    for filename in filenames:
+        path = directory / filename
+        if path.exists():
+            removed += 1
+        _discard(path)
+        _discard(directory / f"{filename}.gz")
+        for variant in IMAGE_VARIANTS:
+            _discard(directory / variant_filename(filename, variant))
+    return removed
+
+
+class UploadStore:
+    """내용 주소 기반 업로드 저장소
+
+    파일명은 sha256 + 확장자라서 같은 차트/PDF를 여러 방에 올려도 파일은 하나다.
+    upload_blobs에 파일별 크기와 마지막 업로드 시각을 기록하고, 참조 여부는 messages.file_url로 확인한다.
+    메시지/방 삭제 후 collect로 더 이상 참조되지 않는 파일(파생본 포함)을 지우고,
+    UPLOAD_GC_INTERVAL_SECONDS마다 전체를 한 번 훑는다 (sweep).
+    업로드 후 메시지를 보내기 전인 파일을 지우지 않도록 마지막 업로드 후 grace 동안은 남겨 둔다.
+    """
+
+    def __init__(self, session_factory, directory: Path = UPLOAD_DIR, grace: float = UPLOAD_GC_GRACE_SECONDS,
+                 interval: float = UPLOAD_GC_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.directory = directory
+        self.grace = grace
+        self.interval = interval
+        self.lock = asyncio.Lock()  # 같은 워커 안에서 저장(중복 확인)과 삭제가 겹치지 않도록
+        self.task = None
+        self.stats = {"uploads": 0, "deduplicated": 0, "bytes_saved": 0, "collected": 0, "sweeps": 0, "gc_failures": 0}
+
+    async def start(self):
+        self.task = asyncio.create_task(self._gc_loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def save(self, file: UploadFile, ext: str, max_bytes: int, detail: str) -> str:
+        """업로드 파일을 저장하고 파일명 반환. max_bytes를 넘으면 413 (미들웨어와 같은 응답)"""
+        tmp_path = UPLOAD_TMP_DIR / f"{uuid.uuid4()}.part"
+        try:
+            result = await asyncio.to_thread(_copy_to_temp, file.file, tmp_path, max_bytes)
+            if result is None:
+                raise HTTPException(status_code=413, detail=detail)
+            size, sha256 = result
+            filename = f"{sha256}{ext}"
+            async with self.lock:
+                # 기록을 먼저 갱신해야 동시에 도는 정리가 이 파일을 유예 기간 안으로 봄
+                await self._touch(filename, sha256, size)
+                placed = await asyncio.to_thread(_place, tmp_path, self.directory / filename)
+        except BaseException:
+            await asyncio.to_thread(_discard, tmp_path)
+            raise
+        if placed and ext in PRECOMPRESS_EXTENSIONS:
+            try:
+                await asyncio.to_thread(_precompress, self.directory / filename)
+            except OSError as e:
+                print(f"[UPLOAD] 압축본 생성 실패 {filename}: {e}")
+        self.stats["uploads"] += 1
+        if not placed:
+            self.stats["deduplicated"] += 1
+            self.stats["bytes_saved"] += size
+        return filename
+
+    async def _touch(self, filename: str, sha256: str, size: int):
+        """upload_blobs 기록 (이미 있으면 업로드 횟수/시각 갱신)"""
+        now = datetime.utcnow()
+        touch = update(models.UploadBlob).where(models.UploadBlob.filename == filename).values(
+            upload_count=models.UploadBlob.upload_count + 1, last_uploaded_at=now
+        )
+        async with self.session_factory() as db:
+            if not (await db.execute(touch)).rowcount:
+                db.add(models.UploadBlob(filename=filename, sha256=sha256, size=size, created_at=now, last_uploaded_at=now))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # 다른 워커가 같은 파일을 동시에 기록함
+                await db.rollback()
+                await db.execute(touch)
+                await db.commit()
+
+    def _filename(self, file_url: str):
+        if not file_url or not file_url.startswith("/uploads/"):
+            return None
+        filename = file_url[len("/uploads/"):]
+        return filename if UPLOAD_FILENAME.match(filename) else None
+
+    async def collect(self, file_urls) -> int:
+        """참조하는 메시지가 없어진 업로드 파일 삭제 (메시지/방 삭제 후). 삭제한 파일 수 반환"""
+        filenames = {filename for filename in map(self._filename, file_urls) if filename}
+        if not filenames:
+            return 0
+        try:
+            async with self.lock:
+                removable = await self._unreferenced(filenames)
+                removed = await asyncio.to_thread(_remove_files, self.directory, removable)
+        except Exception as e:
+            self.stats["gc_failures"] += 1
+            print(f"[UPLOAD] 파일 정리 실패: {e}")
+            return 0
+        self.stats["collected"] += removed
+        return removed
+
+    async def _unreferenced(self, filenames: set) -> list:
+        """filenames 중 참조가 없고 유예 기간이 지난 것 (upload_blobs 기록도 삭제)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace)
+        async with self.session_factory() as db:
+            referenced = set((await db.scalars(
+                select(models.Message.file_url).where(
+                    models.Message.file_url.in_([f"/uploads/{filename}" for filename in filenames])
+                ).distinct()
+            )).all())
+            blobs = {blob.filename: blob for blob in (await db.scalars(
+                select(models.UploadBlob).where(models.UploadBlob.filename.in_(filenames))
+            )).all()}
+            removable = []
+            for filename in filenames:
+                if f"/uploads/{filename}" in referenced:
+                    continue
+                blob = blobs.get(filename)
+                if blob is not None:
+                    if blob.last_uploaded_at and blob.last_uploaded_at > cutoff:
+                        # 방금 올라온 파일 - 아직 메시지 전송 전일 수 있음 (다음 sweep에서 다시 확인)
+                        continue
+                    await db.delete(blob)
+                removable.append(filename)
+            await db.commit()
+        return removable
+
+    async def sweep(self) -> int:
+        """유예 기간이 지났고 참조하는 메시지가 없는 파일 전체 정리"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace)
+        referenced = exists().where(models.Message.file_url == literal("/uploads/") + models.UploadBlob.filename)
+        async with self.session_factory() as db:
+            filenames = (await db.scalars(
+                select(models.UploadBlob.filename).where(models.UploadBlob.last_uploaded_at < cutoff, ~referenced)
+            )).all()
+        self.stats["sweeps"] += 1
+        return await self.collect([f"/uploads/{filename}" for filename in filenames])
+
+    async def _gc_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    print(f"[UPLOAD] 참조 없는 파일 {removed}개 정리")
+            except Exception as e:
+                self.stats["gc_failures"] += 1
+                print(f"[UPLOAD] 파일 정리 실패: {e}")
+
+    def get_stats(self):
+        return {**self.stats, "grace_seconds": self.grace, "interval_seconds": self.interval}
+
+
+def clean_temp_files():
+    """이전 실행에서 남은 임시 파일 삭제 (시작 시)"""
+    UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    for path in UPLOAD_TMP_DIR.glob("*.part"):
+        _discard(path)
+
+
+def _accepts_gzip(request_headers: Headers) -> bool:
+    for token in request_headers.get("accept-encoding", "").split(","):
+        coding, _, params = token.strip().partition(";")
+        if coding.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def parse_range(value: str, size: int):
+    """단일 바이트 범위 "bytes=a-b" / "bytes=a-" / "bytes=-n" -> (start, end), end 포함
+
+    여러 범위나 잘못된 형식이면 None (Range를 무시하고 전체 응답),
+    파일 범위를 벗어나면 (size, size) (416)
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash or not (first + last).isdigit():
+        return None
+    if not first:
+        suffix = int(last)
+        return (max(size - suffix, 0), size - 1) if suffix and size else (size, size)
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        return (size, size)
+    return start, min(end, size - 1)
+
+
+class UploadFileResponse(FileResponse):
+    """업로드 파일 응답: immutable 캐시, 강한 ETag, 단일 Range(206/416), 가능하면 zero-copy 전송"""
+
+    def __init__(self, path, stat_result, request_headers: Headers, media_type: str = None,
+                 content_encoding: str = None, etag: str = None, vary: bool = False, stats: dict = None):
+        headers = {"cache-control": UPLOAD_CACHE_CONTROL}
+        if etag:
+            headers["etag"] = etag
+        if content_encoding:
+            headers["content-encoding"] = content_encoding
+        else:
+            headers["accept-ranges"] = "bytes"
+        if vary:
+            headers["vary"] = "Accept-Encoding"
+        size = stat_result.st_size
+        self.offset, self.count = 0, size
+        status_code = 200
+        byte_range = None
+        if not content_encoding and "range" in request_headers and self._if_range_matches(request_headers, etag):
+            byte_range = parse_range(request_headers["range"], size)
+        if byte_range == (size, size):
+            status_code = 416
+            self.count = 0
+            headers["content-range"] = f"bytes */{size}"
+            headers["content-length"] = "0"
+        elif byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            self.offset, self.count = start, end - start + 1
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            headers["content-length"] = str(self.count)
+        self.stats = stats
+        super().__init__(path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result)
+
+    @staticmethod
+    def _if_range_matches(request_headers: Headers, etag: str) -> bool:
+        """If-Range가 없거나 현재 ETag와 같을 때만 Range 적용 (다르면 전체 응답)"""
+        if_range = request_headers.get("if-range")
+        return if_range is None or (etag is not None and if_range.strip() == etag)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        file = await asyncio.to_thread(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                # 서버가 지원하면 os.sendfile로 커널에서 바로 전송
+                if self.stats is not None:
+                    self.stats["zerocopy"] += 1
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+                return
+            await asyncio.to_thread(file.seek, self.offset)
+            remaining = self.count
+            while remaining:
+                chunk = await asyncio.to_thread(file.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break  # 전송 중 파일이 줄어듦 (정리됨)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await asyncio.to_thread(file.close)
+
+
+class UploadFiles(StaticFiles):
+    """/uploads 정적 파일
+
+    - Cache-Control immutable + 강한 ETag (sha256 파일명은 해시 그대로, 그 외는 크기/수정 시각)
+    - 단일 Range 요청은 206으로 일부만 전송 (PDF 뷰어, 다운로드 이어받기)
+    - Accept-Encoding: gzip이고 업로드 시 만들어 둔 .gz가 있으면 그것을 전송
+    - 없는 이미지 파생본은 처음 요청될 때 만들어서 응답
+    """
+
+    def __init__(self, *, image_processor: ImageProcessor = None, **kwargs):
+        super().__init__(**kwargs)
+        self.image_processor = image_processor
+        self.stats = {"responses": 0, "not_modified": 0, "partial": 0, "precompressed": 0, "zerocopy": 0}
+
+    async def get_response(self, path: str, scope):
+        if any(part.startswith(".") for part in Path(path).parts):
+            # 임시 파일(.tmp) 등은 노출하지 않음
+            raise StarletteHTTPException(status_code=404)
+        response = await self._precompressed_response(path, scope)
+        if response is not None:
+            return response
+        try:
+            return await super().get_response(path, scope)
+        except StarletteHTTPException as exc:
+            parsed = parse_variant_filename(path)
+            if exc.status_code != 404 or parsed is None or self.image_processor is None:
+                raise
+            if not await self.image_processor.process(parsed[0], lazy=True):
+                raise
+            return await super().get_response(path, scope)
+
+    async def _precompressed_response(self, path: str, scope):
+        """미리 압축해 둔 path.gz 응답. 대상이 아니거나 .gz가 없으면 None"""
+        if scope["method"] not in ("GET", "HEAD") or Path(path).suffix.lower() not in PRECOMPRESS_EXTENSIONS:
+            return None
+        request_headers = Headers(scope=scope)
+        if "range" in request_headers or not _accepts_gzip(request_headers):
+            # Range는 원본 기준이라 압축본으로는 응답하지 않음
+            return None
+        full_path, stat_result = await asyncio.to_thread(self.lookup_path, f"{path}.gz")
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None
+        return self.file_response(full_path, stat_result, scope, original=path, content_encoding="gzip")
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200, original: str = None,
+                      content_encoding: str = None):
+        request_headers = Headers(scope=scope)
+        name = os.path.basename(original or full_path)
+        match = SHA256_FILENAME.match(name)
+        if match:
+            etag = f'"{match.group(1)}"'  # 내용 해시 = 강한 ETag (서버/디스크가 달라도 같음)
+        else:
+            etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+        if content_encoding:
+            etag = f'{etag[:-1]}-{content_encoding}"'
+        response = UploadFileResponse(
+            full_path, stat_result, request_headers,
+            media_type=guess_type(name)[0] or "application/octet-stream",
+            content_encoding=content_encoding,
+            etag=etag,
+            vary=os.path.splitext(name)[1].lower() in PRECOMPRESS_EXTENSIONS,
+            stats=self.stats,
+        )
+        self.stats["responses"] += 1
+        if self.is_not_modified(response.headers, request_headers):
+            self.stats["not_modified"] += 1
+            return NotModifiedResponse(response.headers)
+        if response.status_code == 206:
+            self.stats["partial"] += 1
+        if content_encoding:
+            self.stats["precompressed"] += 1
+        return response
+
+    def get_stats(self):
+        return {**self.stats, "cache_control": UPLOAD_CACHE_CONTROL}
@@ -220,6 +220,8 @@ function ChatList({ user, onLogout }) {
       ws.onopen = () => {
         console.log('✅ WebSocket 연결됨');
         setWsConnected(true);
+        // 연결이 끊긴 동안 놓친 배지 갱신
+        loadUnreadCounts();
       };
       
       ws.onmessage = (event) => {
@@ -227,8 +229,19 @@ function ChatList({ user, onLogout }) {
           const data = JSON.parse(event.data);
           console.log('📨 WebSocket 데이터:', data);
           
-          // 모든 메시지 처리 (type 상관없이)
-          if (data.type === 'message' || data.content) {
+          if (data.type === 'unread') {
+            // 다른 유료방에 새 메시지 - 배지만 증가
+            setUnreadCounts(prev => ({
+              ...prev,
+              [data.room_id]: (prev[data.room_id] || 0) + (data.delta || 1)
+            }));
+          } else if (data.type === 'read') {
+            // 이 사용자가 (다른 탭/기기 포함) 읽음 처리한 결과
+            setUnreadCounts(prev => ({ ...prev, [data.room_id]: data.unread }));
+          } else if (data.type === 'hello' || data.type === 'resync') {
+            // 재연결 제어 메시지는 무시
+          } else if (data.type === 'message' || data.content) {
+            // 모든 메시지 처리 (type 상관없이)
             handleSignal({
               content: data.content || data.message?.content || '',
               message_type: data.message_type || data.type,
@@ -387,8 +400,11 @@ function ChatList({ user, onLogout }) {
       return;
     }
     
-    // 유료방 클릭 시 읽음 표시
-    if (!isFree && user) {
+    // 유료방 클릭 시 읽음 표시 (WebSocket이 열려 있으면 프레임으로, 아니면 REST)
+    if (!isFree && user && wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ type: 'read', room_id: roomId }));
+      setUnreadCounts(prev => ({...prev, [roomId]: 0}));
+    } else if (!isFree && user) {
       try {
         const token = localStorage.getItem('token');
         await axios.post(`${API_URL}/api/rooms/${roomId}/read`, {}, {
@@ -5,6 +5,8 @@ import './ChatRoom.css';
 
 const API_URL = process.env.REACT_APP_API_URL || 'https://investment-academy1-backend.onrender.com';
 const WS_URL = process.env.REACT_APP_WS_URL || 'wss://investment-academy1-backend.onrender.com';
+const MESSAGE_PAGE_SIZE = 50;  // 서버 기본 페이지 크기와 같게
+const READ_ACK_INTERVAL_MS = 1000;  // 읽음 확인은 최대 1초에 한 번 (마지막 id만)
 
 // 오디오 컨텍스트 (전역)
 let audioContext = null;
@@ -95,6 +97,7 @@ function ChatRoom({ user, onLogin, onLogout }) {
   const [showEmojiPicker, setShowEmojiPicker] = useState(false);
   const [showToolbar, setShowToolbar] = useState(false);  // 도구 버튼 토글
   const [reactions, setReactions] = useState({});  // {messageId: {heart: count, thumbsup: count}}
+  const [myReactions, setMyReactions] = useState({});  // {messageId: ['heart', ...]} 내가 누른 리액션
   const [uploadingImage, setUploadingImage] = useState(false);
   const [uploadingFile, setUploadingFile] = useState(false);
   const [disclaimerAccepted, setDisclaimerAccepted] = useState(() => {
@@ -119,6 +122,11 @@ function ChatRoom({ user, onLogin, onLogout }) {
   const wsRef = useRef(null);
   const reconnectTimeoutRef = useRef(null);
   const searchInputRef = useRef(null);
+  const replayRef = useRef({ epoch: null, seq: null });  // 재연결 시 놓친 이벤트만 받기 위한 위치
+  const [hasOlder, setHasOlder] = useState(true);  // 더 오래된 메시지가 남아 있는지
+  const loadingOlderRef = useRef(false);
+  const keepScrollRef = useRef(null);  // 이전 메시지를 앞에 붙일 때 스크롤 위치 유지용 (붙이기 전 scrollHeight)
+  const readAckRef = useRef({ messageId: null, timer: null });  // 아직 보내지 않은 읽음 확인
 
   // 소리 설정 저장
   useEffect(() => {
@@ -170,6 +178,7 @@ function ChatRoom({ user, onLogin, onLogout }) {
     // ChatRoom에서만 body 스크롤 방지
     document.body.style.overflow = 'hidden';
     
+    replayRef.current = { epoch: null, seq: null };
     loadRoomInfo();
     loadMessages();
 
@@ -178,6 +187,10 @@ function ChatRoom({ user, onLogin, onLogout }) {
       document.body.style.overflow = '';
       
       // cleanup: WebSocket 연결 종료
+      if (readAckRef.current.timer) {
+        clearTimeout(readAckRef.current.timer);
+      }
+      readAckRef.current = { messageId: null, timer: null };
       if (reconnectTimeoutRef.current) {
         clearTimeout(reconnectTimeoutRef.current);
         reconnectTimeoutRef.current = null;
@@ -215,6 +228,13 @@ function ChatRoom({ user, onLogin, onLogout }) {
   }, [user, roomId]);
 
   useEffect(() => {
+    if (keepScrollRef.current !== null && messagesContainerRef.current) {
+      // 위로 스크롤해서 이전 메시지를 불러온 경우 보던 위치 유지
+      const container = messagesContainerRef.current;
+      container.scrollTop = container.scrollHeight - keepScrollRef.current;
+      keepScrollRef.current = null;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
 
@@ -243,6 +263,20 @@ function ChatRoom({ user, onLogin, onLogout }) {
     }
   };
 
+  // 메시지 목록에 포함된 리액션 수/내 리액션 반영
+  const applyMessageReactions = (list) => {
+    setReactions(prev => {
+      const next = { ...prev };
+      list.forEach(m => { if (m.reactions) next[m.id] = m.reactions; });
+      return next;
+    });
+    setMyReactions(prev => {
+      const next = { ...prev };
+      list.forEach(m => { if (m.my_reactions) next[m.id] = m.my_reactions; });
+      return next;
+    });
+  };
+
   const loadMessages = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -250,6 +284,8 @@ function ChatRoom({ user, onLogin, onLogout }) {
         headers: token ? { Authorization: `Bearer ${token}` } : {}
       });
       setMessages(response.data);
+      applyMessageReactions(response.data);
+      setHasOlder(response.data.length >= MESSAGE_PAGE_SIZE);
     } catch (error) {
       console.error('메시지 로딩 실패:', error);
       // 로그인 필요한 경우
@@ -259,6 +295,58 @@ function ChatRoom({ user, onLogin, onLogout }) {
     }
   };
 
+  // 위로 스크롤 시 이전 메시지 불러오기 (가장 오래된 메시지 id 기준 커서)
+  const loadOlderMessages = async () => {
+    if (loadingOlderRef.current || !hasOlder || messages.length === 0) return;
+    loadingOlderRef.current = true;
+    try {
+      const token = localStorage.getItem('token');
+      const response = await axios.get(`${API_URL}/api/rooms/${roomId}/messages`, {
+        params: { before_id: messages[0].id, limit: MESSAGE_PAGE_SIZE },
+        headers: token ? { Authorization: `Bearer ${token}` } : {}
+      });
+      const older = response.data;
+      applyMessageReactions(older);
+      setHasOlder(older.length >= MESSAGE_PAGE_SIZE);
+      if (older.length > 0 && messagesContainerRef.current) {
+        keepScrollRef.current = messagesContainerRef.current.scrollHeight;
+        setMessages(prev => {
+          const known = new Set(prev.map(m => m.id));
+          return [...older.filter(m => !known.has(m.id)), ...prev];
+        });
+      }
+    } catch (error) {
+      console.error('이전 메시지 로딩 실패:', error);
+    } finally {
+      loadingOlderRef.current = false;
+    }
+  };
+
+  const handleMessagesScroll = (e) => {
+    if (e.target.scrollTop < 80) {
+      loadOlderMessages();
+    }
+  };
+
+  // 읽음 확인 - 메시지마다 보내지 않고 READ_ACK_INTERVAL_MS 동안 모아서 마지막 id만 전송
+  const flushReadAck = () => {
+    const ack = readAckRef.current;
+    ack.timer = null;
+    if (ack.messageId === null || document.visibilityState !== 'visible') return;
+    if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({ type: 'read', message_id: ack.messageId }));
+    }
+    ack.messageId = null;
+  };
+
+  const queueReadAck = (messageId) => {
+    const ack = readAckRef.current;
+    ack.messageId = Math.max(ack.messageId || 0, messageId);
+    if (!ack.timer) {
+      ack.timer = setTimeout(flushReadAck, READ_ACK_INTERVAL_MS);
+    }
+  };
+
   const connectWebSocket = () => {
     if (!user) return;
     
@@ -274,17 +362,33 @@ function ChatRoom({ user, onLogin, onLogout }) {
     if (!token) return;
     
     console.log('WebSocket 연결 시도...');
-    const websocket = new WebSocket(`${WS_URL}/ws/chat/${roomId}?token=${token}`);
+    // 재연결이면 마지막으로 받은 위치를 보내서 놓친 이벤트만 재전송 받기
+    const { epoch, seq } = replayRef.current;
+    const resume = epoch && seq !== null ? `&last_seq=${seq}&epoch=${epoch}` : '';
+    const websocket = new WebSocket(`${WS_URL}/ws/chat/${roomId}?token=${token}${resume}`);
 
     websocket.onopen = () => {
       console.log('WebSocket 연결됨');
       setConnected(true);
+      // 방에 들어왔으면 최신 메시지까지 읽음 처리
+      websocket.send(JSON.stringify({ type: 'read' }));
     };
 
     websocket.onmessage = (event) => {
       const data = JSON.parse(event.data);
       
-      if (data.type === 'message') {
+      if (typeof data.seq === 'number' && data.type !== 'hello') {
+        replayRef.current.seq = Math.max(replayRef.current.seq || 0, data.seq);
+      }
+      
+      if (data.type === 'hello') {
+        // 재전송 이벤트는 모두 이 seq 이하
+        replayRef.current = { epoch: data.epoch, seq: data.seq };
+      } else if (data.type === 'resync') {
+        // 서버 버퍼 범위를 벗어남 - 전체 메시지 다시 로드
+        replayRef.current.seq = data.seq;
+        loadMessages();
+      } else if (data.type === 'message') {
         const newMsg = {
           id: data.id,
           user_id: data.user_id,
@@ -292,6 +396,7 @@ function ChatRoom({ user, onLogin, onLogout }) {
           message_type: data.message_type,
           file_url: data.file_url,
           file_name: data.file_name,
+          variants: data.variants,
           created_at: data.timestamp,
           user: {
             name: data.user_name,
@@ -299,7 +404,13 @@ function ChatRoom({ user, onLogin, onLogout }) {
           }
         };
         
-        setMessages(prev => [...prev, newMsg]);
+        // 재전송된 이벤트가 이미 있는 메시지면 무시
+        setMessages(prev => prev.some(m => m.id === newMsg.id) ? prev : [...prev, newMsg]);
+        
+        // 보고 있는 중이면 읽음 확인 (모아서 전송, 서버도 모아서 저장)
+        if (document.visibilityState === 'visible') {
+          queueReadAck(data.id);
+        }
         
         // 시그널 메시지 감지 시 알림
         const content = data.content || '';
@@ -437,6 +548,13 @@ function ChatRoom({ user, onLogin, onLogout }) {
         ...prev,
         [messageId]: response.data.counts
       }));
+      setMyReactions(prev => {
+        const mine = (prev[messageId] || []).filter(type => type !== reactionType);
+        return {
+          ...prev,
+          [messageId]: response.data.action === 'added' ? [...mine, reactionType] : mine
+        };
+      });
     } catch (error) {
       console.error('리액션 실패:', error);
     }
@@ -731,10 +849,17 @@ function ChatRoom({ user, onLogin, onLogout }) {
             </button>
           )}
           <img 
-            src={getFileUrl(message.file_url)} 
+            src={getFileUrl(message.variants?.preview || message.file_url)} 
             alt={message.file_name}
+            loading="lazy"
             onClick={() => window.open(getFileUrl(message.file_url), '_blank')}
             onError={(e) => {
+              // 미리보기(WebP)를 만들 수 없는 이미지면 원본으로 다시 시도
+              if (message.variants?.preview && !e.target.dataset.fallback) {
+                e.target.dataset.fallback = 'original';
+                e.target.src = getFileUrl(message.file_url);
+                return;
+              }
               console.log('이미지 로드 실패:', message.file_url);
               e.target.style.display = 'none';
             }}
@@ -807,13 +932,13 @@ function ChatRoom({ user, onLogin, onLogout }) {
           )}
           <div className="reaction-buttons">
             <button 
-              className={`reaction-btn ${reactions[message.id]?.heart > 0 ? 'active' : ''}`}
+              className={`reaction-btn ${myReactions[message.id]?.includes('heart') ? 'active' : ''}`}
               onClick={() => handleReaction(message.id, 'heart')}
             >
               ❤️ {reactions[message.id]?.heart || 0}
             </button>
             <button 
-              className={`reaction-btn ${reactions[message.id]?.thumbsup > 0 ? 'active' : ''}`}
+              className={`reaction-btn ${myReactions[message.id]?.includes('thumbsup') ? 'active' : ''}`}
               onClick={() => handleReaction(message.id, 'thumbsup')}
             >
               👍 {reactions[message.id]?.thumbsup || 0}
@@ -913,7 +1038,7 @@ function ChatRoom({ user, onLogin, onLogout }) {
         </div>
       )}
 
-      <div className="messages-container" ref={messagesContainerRef}>
+      <div className="messages-container" ref={messagesContainerRef} onScroll={handleMessagesScroll}>
         {/* 면책조항 슬라이드 (로그인 안 한 경우) */}
         {!user && !disclaimerAccepted && (
           <div className="disclaimer-overlay">
@@ -984,13 +1109,13 @@ function ChatRoom({ user, onLogin, onLogout }) {
                   <div className="message-time">{formatTime(message.created_at)}</div>
                   <div className="reaction-buttons">
                     <button 
-                      className={`reaction-btn ${reactions[message.id]?.heart > 0 ? 'active' : ''}`}
+                      className={`reaction-btn ${myReactions[message.id]?.includes('heart') ? 'active' : ''}`}
                       onClick={() => handleReaction(message.id, 'heart')}
                     >
                       ❤️ {reactions[message.id]?.heart || 0}
                     </button>
                     <button 
-                      className={`reaction-btn ${reactions[message.id]?.thumbsup > 0 ? 'active' : ''}`}
+                      className={`reaction-btn ${myReactions[message.id]?.includes('thumbsup') ? 'active' : ''}`}
                       onClick={() => handleReaction(message.id, 'thumbsup')}
                     >
                       👍 {reactions[message.id]?.thumbsup || 0}